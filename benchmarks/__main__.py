@@ -0,0 +1,242 @@
+"""
+Benchmarks for the report rendering hot paths
+
+    python -m benchmarks [--sizes 100KB 1MB] [--output results.json] [--baseline results.json]
+
+Measures, against a throwaway test database:
+
+* process_html time, throughput and peak memory for each size of synthetic notebook
+  export in benchmarks.corpus
+* report_view latency with a cold cache (straight after the report is rendered) and
+  a warm one, with the report's remote replaced by a stub
+* the number of queries made by the landing page, which must not grow with the
+  number of reports
+
+Pass --baseline with the --output of a previous run to exit with an error if any
+timing has regressed by more than --tolerance, or any query count has grown.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from unittest import mock
+
+
+# the same settings as the tests
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "reports.settings")
+os.environ.setdefault("SECRET_KEY", "benchmarks")
+os.environ.setdefault("REQUESTS_CACHE_NAME", "benchmarks_cache")
+os.environ["ASSETS_DEV_MODE"] = "True"
+os.environ["RENDER_REPORTS_IN_BACKGROUND"] = "False"
+os.environ["GITHUB_VALIDATION"] = "False"
+
+import django  # noqa: E402
+
+
+django.setup()
+logging.disable(logging.CRITICAL)
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+
+from benchmarks.corpus import SIZES, notebook_export  # noqa: E402
+from reports.models import Org  # noqa: E402
+from reports.rendering import process_html, render_report  # noqa: E402
+from tests.factories import ReportFactory  # noqa: E402
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(func):
+    """
+    Return the growth in peak resident memory, in bytes, caused by calling `func`
+
+    Most of the memory used by lxml is allocated by libxml2 rather than by Python, so
+    it's measured in a forked child process, whose peak starts at its size when forked.
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child
+        os.close(read)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        func()
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write, str((after - before) * 1024).encode())
+        os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read) as f:
+        result = int(f.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def benchmark_process_html(sizes, repeat):
+    results = {}
+    for name in sizes:
+        html = notebook_export(SIZES[name])
+        megabytes = len(html.encode()) / 1024 / 1024
+        seconds = best_time(lambda: process_html(html), repeat)
+        results[name] = {
+            "seconds": seconds,
+            "mb_per_second": megabytes / seconds,
+            "peak_memory_mb": peak_memory(lambda: process_html(html)) / 1024 / 1024,
+        }
+    return results
+
+
+def stub_remote(html):
+    remote = mock.Mock()
+    remote.get_html.return_value = html
+    return mock.patch("reports.rendering.get_remote", return_value=remote)
+
+
+def benchmark_report_view(sizes, repeat):
+    client = Client()
+    org = Org.objects.get(slug="bennett")
+    results = {}
+    for name in sizes:
+        report = ReportFactory(org=org, is_draft=False)
+        with stub_remote(notebook_export(SIZES[name])):
+            render_report(report)
+        url = report.get_absolute_url()
+
+        def get():
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+
+        # load and compile templates, so only the caches are cold
+        get()
+        cold = []
+        for _ in range(repeat):
+            cache.clear()
+            start = time.perf_counter()
+            get()
+            cold.append(time.perf_counter() - start)
+
+        get()
+        results[name] = {
+            "cold_seconds": min(cold),
+            "warm_seconds": best_time(get, repeat),
+        }
+    return results
+
+
+def benchmark_landing_queries(report_counts):
+    client = Client()
+    org = Org.objects.get(slug="bennett")
+    results = {}
+    for count in report_counts:
+        while org.reports.count() < count:
+            ReportFactory(org=org, is_draft=False)
+        # the first request populates the navigation cache
+        client.get("/")
+        with CaptureQueriesContext(connection) as queries:
+            client.get("/")
+        results[str(count)] = len(queries)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of each result that has regressed from the baseline"""
+    regressions = []
+
+    def walk(path, result, base):
+        if isinstance(result, dict):
+            for key, value in result.items():
+                if key in base:
+                    walk(f"{path}.{key}", value, base[key])
+        elif path.startswith("landing_queries"):
+            if result > base:
+                regressions.append(f"{path}: {base} -> {result} queries")
+        elif path.endswith("seconds") and result > base * (1 + tolerance):
+            regressions.append(f"{path}: {base:.4f}s -> {result:.4f}s")
+
+    for key, value in results.items():
+        walk(key, value, baseline.get(key, {}))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", choices=list(SIZES), default=list(SIZES), metavar="SIZE"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this results JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="fraction by which timings may exceed the baseline (default 0.25)",
+    )
+    args = parser.parse_args(argv)
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+    try:
+        results = {
+            "process_html": benchmark_process_html(args.sizes, args.repeat),
+            "report_view": benchmark_report_view(args.sizes, args.repeat),
+            "landing_queries": benchmark_landing_queries([1, 10, 100]),
+        }
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+    for name, result in results["process_html"].items():
+        print(
+            f"process_html {name:>6}: {result['seconds'] * 1000:9.1f}ms "
+            f"{result['mb_per_second']:6.1f}MB/s "
+            f"peak {result['peak_memory_mb']:7.1f}MB"
+        )
+    for name, result in results["report_view"].items():
+        print(
+            f"report_view  {name:>6}: cold {result['cold_seconds'] * 1000:7.1f}ms "
+            f"warm {result['warm_seconds'] * 1000:7.1f}ms"
+        )
+    for count, queries in results["landing_queries"].items():
+        print(f"landing      {count:>3} reports: {queries} queries")
+
+    # written before the checks, so that a failing run's results can be inspected
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if len(set(results["landing_queries"].values())) > 1:
+        print("landing query count grows with the number of reports", file=sys.stderr)
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
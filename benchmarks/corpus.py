@@ -0,0 +1,114 @@
+"""
+Synthetic report HTML files, shaped like Jupyter notebooks exported with nbconvert
+
+Each file has the parts of a real export that matter to the renderer: a head full of
+inline CSS and scripts (which is removed), and a body of code cells with syntax
+highlighted source in <pre>s, dataframe <table>s, base64 encoded PNG plots and
+markdown.  Files are generated deterministically, so runs are comparable.
+"""
+
+import base64
+import random
+
+
+SIZES = {
+    "100KB": 100 * 1024,
+    "1MB": 1024 * 1024,
+    "10MB": 10 * 1024 * 1024,
+    "50MB": 50 * 1024 * 1024,
+}
+
+HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<title>report</title>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/require.js/2.1.10/require.min.js"></script>
+<style type="text/css">
+{css}
+</style>
+</head>
+<body class="jp-Notebook" data-jp-theme-light="true">
+"""
+
+FOOT = """</body>
+</html>
+"""
+
+
+def _code_cell(rng, number):
+    lines = "".join(
+        f'<span class="n">df_{line}</span> <span class="o">=</span> '
+        f'<span class="n">pd</span><span class="o">.</span><span class="n">read_csv</span>'
+        f'<span class="p">(</span><span class="s2">"output/measure_{number}_{line}.csv"</span>'
+        f'<span class="p">)</span>\n'
+        for line in range(rng.randint(3, 12))
+    )
+    return (
+        '<div class="jp-Cell jp-CodeCell jp-Notebook-cell">'
+        '<div class="jp-InputArea jp-Cell-inputArea">'
+        f'<div class="jp-InputPrompt jp-InputArea-prompt">In&nbsp;[{number}]:</div>'
+        f'<div class="highlight hl-ipython3"><pre>{lines}</pre></div>'
+        "</div>"
+    )
+
+
+def _dataframe(rng):
+    columns = rng.randint(4, 10)
+    header = "".join(f"<th>column_{column}</th>" for column in range(columns))
+    rows = "".join(
+        f"<tr><th>{row}</th>"
+        + "".join(f"<td>{rng.random() * 1000:.3f}</td>" for _ in range(columns))
+        + "</tr>\n"
+        for row in range(rng.randint(5, 40))
+    )
+    return (
+        '<div class="jp-OutputArea-output jp-RenderedHTMLCommon">'
+        f'<table border="1" class="dataframe"><thead><tr><th></th>{header}</tr></thead>'
+        f"<tbody>{rows}</tbody></table></div>"
+    )
+
+
+def _plot(rng):
+    # random bytes don't compress, like the image data in a real PNG
+    data = base64.b64encode(rng.randbytes(rng.randint(20_000, 80_000))).decode()
+    return (
+        '<div class="jp-RenderedImage jp-OutputArea-output">'
+        f'<img alt="No description has been provided for this image" src="data:image/png;base64,{data}" />'
+        "</div>"
+    )
+
+
+def _markdown(rng, number):
+    return (
+        '<div class="jp-Cell jp-MarkdownCell jp-Notebook-cell">'
+        f'<h2 id="section-{number}">Section {number}<a class="anchor-link" href="#section-{number}">&#182;</a></h2>'
+        f"<p>Counts below 7 are redacted &amp; all values are rounded to the nearest "
+        f"<strong>{rng.randint(5, 10)}</strong>.</p></div>\n"
+    )
+
+
+def notebook_export(size, seed=0):
+    """Return a synthetic notebook export of at least `size` characters"""
+    rng = random.Random(seed)
+    css = "\n".join(
+        f".jp-Cell-{rule} {{ margin: 0; padding: {rule % 8}px; color: var(--jp-{rule}); }}"
+        for rule in range(200)
+    )
+    parts = [HEAD.format(css=css)]
+    length = len(parts[0]) + len(FOOT)
+
+    number = 0
+    while length < size:
+        number += 1
+        cell = _markdown(rng, number) + _code_cell(rng, number)
+        cell += '<div class="jp-OutputArea jp-Cell-outputArea">'
+        cell += _dataframe(rng)
+        if number % 3 == 0:
+            cell += _plot(rng)
+        cell += "</div></div>\n"
+        parts.append(cell)
+        length += len(cell)
+
+    parts.append(FOOT)
+    return "".join(parts)
@@ -6,4 +6,10 @@ set -euo pipefail
 ./manage.py ensure_groups
 ./manage.py createcachetable
 
+# render any reports that don't have a render yet, without holding up startup
+./manage.py render_reports &
+
+# re-render reports when their files change
+./manage.py poll_reports --watch &
+
 exec gunicorn reports.wsgi --config=gunicorn.conf.py
@@ -0,0 +1,88 @@
+"""
+The recent activity listed on the landing page
+
+Each report's most recent activity is kept in a ReportActivity row, updated whenever a
+report's dates or visibility change, so the landing page needn't work it out from every
+report on each request.
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Category, Report, ReportActivity
+from .visibility import user_visibility
+
+
+# Report fields that the activity is made from
+ACTIVITY_REPORT_FIELDS = {"publication_date", "last_updated", "is_draft", "category"}
+
+# matches views.archive_category_name
+ARCHIVE_CATEGORY_NAME = "archive"
+
+
+def is_archive(category_name):
+    return category_name.casefold() == ARCHIVE_CATEGORY_NAME
+
+
+def update_report_activity(report_pk):
+    # read the report back, rather than using an instance whose dates may not have been
+    # converted from what they were set to
+    report = (
+        Report.objects.filter(pk=report_pk)
+        .values("publication_date", "last_updated", "is_draft", "category__name")
+        .get()
+    )
+    published, updated = report["publication_date"], report["last_updated"]
+
+    # A report that is updated on the day it is published is only listed as published,
+    # and one that has been updated since is only listed as updated
+    if updated is None or updated == published:
+        activity, activity_date = ReportActivity.PUBLISHED, published
+    elif updated > published:
+        activity, activity_date = ReportActivity.UPDATED, updated
+    else:
+        # a report updated before it was published isn't listed at all
+        ReportActivity.objects.filter(report_id=report_pk).delete()
+        return
+
+    ReportActivity.objects.update_or_create(
+        report_id=report_pk,
+        defaults={
+            "activity": activity,
+            "activity_date": activity_date,
+            "is_draft": report["is_draft"],
+            "is_archived": is_archive(report["category__name"]),
+        },
+    )
+
+
+def recent_activity(user, limit=10):
+    """
+    Return the reports with the most recent activity that the user can see, most recent
+    first (and then by menu name), annotated with their `activity` and `activity_date`
+
+    Reports in the archive category aren't included.
+    """
+    reports = Report.objects.filter(latest_activity__is_archived=False)
+    # as in ReportManager.for_user, but filtering on the activity's copy of is_draft
+    if not user_visibility(user).can_view_drafts:
+        reports = reports.filter(latest_activity__is_draft=False)
+    return reports.annotate(
+        activity=F("latest_activity__activity"),
+        activity_date=F("latest_activity__activity_date"),
+    ).order_by("-activity_date", "menu_name", "pk")[:limit]
+
+
+@receiver(post_save, sender=Report)
+def update_activity_on_report_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not ACTIVITY_REPORT_FIELDS & set(update_fields):
+        return
+    update_report_activity(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def update_activity_on_category_save(sender, instance, **kwargs):
+    ReportActivity.objects.filter(report__category=instance).update(
+        is_archived=is_archive(instance.name)
+    )
@@ -91,7 +91,7 @@ class ReportAdmin(admin.ModelAdmin):
                 "fields": ["job_server_url"],
             },
         ),
-        ("Caching", {"fields": ["cache_token"]}),
+        ("Caching", {"fields": ["cache_token", "front_matter_token"]}),
         (
             "Front matter",
             {
@@ -132,6 +132,7 @@ class ReportAdmin(admin.ModelAdmin):
         "created_at",
         "created_by",
         "doi_suffix",
+        "front_matter_token",
         "last_updated",
         "updated_at",
         "updated_by",
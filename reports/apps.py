@@ -8,3 +8,8 @@ env = Env()
 class ReportsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "reports"
+
+    def ready(self):
+        # connect the signal receivers that keep the landing page's activity up to date
+        # and clear the cached navigation trees and pages
+        from . import activity, navigation, page_cache  # noqa: F401
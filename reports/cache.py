@@ -0,0 +1,108 @@
+"""
+A cache backend with a small in-process cache in front of a shared one
+
+Every read from the shared cache (the database by default) is a round trip to it, which
+adds up for the navigation tree and report fragments read on every page.  TieredCache
+keeps the entries each process reads or writes in a bounded, least recently used local
+cache for a few seconds, so most reads never leave the process.
+
+Writes and deletes go to both caches, but other processes only see a change once their
+local copy expires, so entries may be up to LOCAL_TIMEOUT seconds stale.  add() and
+incr() always go to the shared cache, so locks and counters stay consistent.
+"""
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# stands in for a missing entry, so that cached Nones are told apart from misses
+_missing = object()
+
+
+class TieredCache(BaseCache):
+    """
+    LOCATION is the alias of the shared cache in CACHES.  OPTIONS can include
+    LOCAL_TIMEOUT, the longest that an entry is kept locally in seconds (default 5), and
+    LOCAL_MAX_ENTRIES, the most entries kept locally (default 300).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.shared_alias = location
+        self.local_timeout = options.get("LOCAL_TIMEOUT", 5)
+        # local caches with the same name share their entries, so every thread in the
+        # process uses the same one
+        self.local = LocMemCache(
+            f"tiered:{location}",
+            {
+                "TIMEOUT": self.local_timeout,
+                "OPTIONS": {"MAX_ENTRIES": options.get("LOCAL_MAX_ENTRIES", 300)},
+            },
+        )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self.local.set(key, value, self._local_timeout(timeout), version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(key, _missing, version)
+        if value is _missing:
+            value = self.shared.get(key, _missing, version)
+            if value is _missing:
+                return default
+            self.local.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.local.get_many(keys, version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from_shared = self.shared.get_many(missing, version)
+            self.local.set_many(from_shared, version=version)
+            found.update(from_shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self.local.set(key, value, self._local_timeout(timeout), version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        self.local.set_many(data, self._local_timeout(timeout), version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        self.local.delete(key, version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.local.has_key(key, version) or self.shared.has_key(key, version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version)
+        return self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self.local.delete_many(keys, version)
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,164 @@
+"""
+Gzip responses built around a pre-compressed report body
+
+Report bodies are compressed once, when they are rendered, into a raw deflate stream
+that ends on a byte boundary without ending the stream (a "sync flush").  Any number of
+such streams can be joined together, so a page can be gzipped by compressing just the
+template around the report body on each request and splicing the three parts together.
+The gzip trailer needs the CRC-32 of the whole page, which is combined from the CRC-32
+stored with the body rather than by reading the body again.
+"""
+
+import re
+import struct
+import zlib
+from uuid import uuid4
+
+from django.template.response import TemplateResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.safestring import mark_safe
+
+
+# the same test as django.middleware.gzip.GZipMiddleware
+re_accepts_gzip = re.compile(r"\bgzip\b")
+
+# gzip header: magic number, deflate, no flags, no mtime, no extra flags, unknown OS
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def compress_fragment(data, level=9):
+    """
+    Compress `data` into a raw deflate stream that can be joined to others
+
+    Returns a tuple of the compressed data, and the CRC-32 and length of `data`.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return compressed, zlib.crc32(data), len(data)
+
+
+def _gf2_matrix_times(matrix, vector):
+    result = 0
+    for row in matrix:
+        if not vector:
+            break
+        if vector & 1:
+            result ^= row
+        vector >>= 1
+    return result
+
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1, crc2, length2):
+    """
+    Return the CRC-32 of two pieces of data joined together, from the CRC-32 of each
+    and the length of the second (a port of zlib's crc32_combine, which Python's zlib
+    module doesn't expose)
+    """
+    if length2 == 0:
+        return crc1
+
+    # operator for one zero bit
+    odd = [0xEDB88320] + [1 << bit for bit in range(31)]
+    # operators for two and four zero bits
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+
+    # apply length2 zeros to crc1, squaring the operator for each bit of length2
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+    return crc1 ^ crc2
+
+
+def iter_gzip_around(prefix, fragment, suffix, level=6, chunk_size=64 * 1024):
+    """
+    Yield a gzip file of `prefix`, a pre-compressed fragment and `suffix` in parts,
+    starting with the compressed prefix, then the fragment in `chunk_size` chunks
+
+    `fragment` is a tuple returned by compress_fragment, or a function returning one,
+    which isn't called until the prefix has been yielded.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    yield (
+        GZIP_HEADER + compressor.compress(prefix) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    )
+
+    if callable(fragment):
+        fragment = fragment()
+    compressed, fragment_crc, fragment_length = fragment
+
+    for start in range(0, len(compressed), chunk_size):
+        yield compressed[start : start + chunk_size]
+
+    crc = crc32_combine(zlib.crc32(prefix), fragment_crc, fragment_length)
+    crc = crc32_combine(crc, zlib.crc32(suffix), len(suffix))
+    length = len(prefix) + fragment_length + len(suffix)
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    yield (
+        compressor.compress(suffix)
+        + compressor.flush(zlib.Z_FINISH)
+        # the length is stored modulo 2^32
+        + struct.pack("<II", crc, length & 0xFFFFFFFF)
+    )
+
+
+def gzip_around(prefix, fragment, suffix, level=6):
+    """
+    Return a gzip file of `prefix`, a pre-compressed fragment and `suffix`
+
+    `fragment` is a tuple returned by compress_fragment.
+    """
+    return b"".join(iter_gzip_around(prefix, fragment, suffix, level))
+
+
+def accepts_gzip(request):
+    return bool(re_accepts_gzip.search(request.headers.get("Accept-Encoding", "")))
+
+
+class GzipFragmentTemplateResponse(TemplateResponse):
+    """
+    A gzipped TemplateResponse, with a pre-compressed fragment in place of one of the
+    template's context variables
+
+    Only the rest of the template is compressed when the response is rendered.
+    """
+
+    # once rendered, the fragment is part of the content, so isn't kept when the
+    # response is pickled (e.g. to be cached)
+    rendering_attrs = TemplateResponse.rendering_attrs + ["fragment", "marker"]
+
+    def __init__(
+        self, request, template, context, fragment_variable, fragment, **kwargs
+    ):
+        # the template is rendered with a marker in place of the fragment, where the
+        # rendered content is split to splice the fragment in
+        self.marker = f"<!-- {uuid4().hex} -->"
+        self.fragment = fragment
+        context = {**context, fragment_variable: mark_safe(self.marker)}
+        super().__init__(request, template, context, **kwargs)
+        self.headers["Content-Encoding"] = "gzip"
+        patch_vary_headers(self, ["Accept-Encoding"])
+
+    @property
+    def rendered_content(self):
+        prefix, suffix = super().rendered_content.split(self.marker)
+        return gzip_around(
+            prefix.encode(self.charset), self.fragment, suffix.encode(self.charset)
+        )
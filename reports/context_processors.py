@@ -1,7 +1,7 @@
-from .models import Category
+from .navigation import nav_tree_for_user
 
 
 def reports(request):
     return {
-        "categories": Category.populated.for_user(request.user),
+        "categories": nav_tree_for_user(request.user),
     }
@@ -1,17 +1,25 @@
-from osgithub import GithubClient
+from datetime import datetime
 
+from osgithub import GithubClient, GithubRepo
 
-class GithubReport:
+from .remote import RemoteReport
+
+
+# seconds to wait to connect, and between bytes received, when checking for changes
+CHECK_TIMEOUT = (3.05, 30)
+
+
+class GithubReport(RemoteReport):
     """
     A class for interacting with a Github repo and html file associated with a single
     Report instance
     """
 
     def __init__(self, report, repo=None, use_cache=True):
+        super().__init__(report)
+        self.use_cache = use_cache
         self.client = GithubClient(use_cache=use_cache)
-        self.report = report
         self._repo = repo
-        self._fetched_html = None
 
     @property
     def repo(self):
@@ -34,45 +42,57 @@ class GithubReport:
             self.report.report_html_file_path, self.report.branch
         )
 
-    def get_html(self):
-        """
-        Fetches a report html file (an exported jupyter notebook) from a github repo based
-        on `report`, a Report model instance.
-        """
-        if self._fetched_html is None:
-            if self.report.use_git_blob:
-                file = self.repo.get_contents(
-                    self.report.report_html_file_path,
-                    self.report.branch,
-                    from_git_blob=True,
-                )
-            else:
-                file, fetch_type = self.repo.get_contents(
-                    self.report.report_html_file_path,
-                    ref=self.report.branch,
-                    return_fetch_type=True,
-                )
-                if fetch_type == "blob":
-                    self.report.use_git_blob = True
-                    self.report.save()
-
-            # convert to a date for Report.last_updated
-            github_last_updated = file.last_updated.date()
-            if self.report.last_updated != github_last_updated:
-                self.report.last_updated = github_last_updated
-                self.report.save()
+    def fetch(self):
+        if self.report.use_git_blob:
+            file = self.repo.get_contents(
+                self.report.report_html_file_path,
+                self.report.branch,
+                from_git_blob=True,
+            )
+        else:
+            file, fetch_type = self.repo.get_contents(
+                self.report.report_html_file_path,
+                ref=self.report.branch,
+                return_fetch_type=True,
+            )
+            if fetch_type == "blob":
+                self.report.use_git_blob = True
+                self.report.save(update_fields=["use_git_blob"])
 
-            self._fetched_html = file.decoded_content
-        return self._fetched_html
+        return file.decoded_content, file.last_updated
 
-    def last_updated(self):
+    def check(self, etag, last_modified):
         """
-        Return the last updated date separately to the fully processed HTML
+        Check the latest commit to the file with a conditional request, which doesn't
+        count towards GitHub's rate limit if it is unchanged
         """
-        self.get_html()
-        # last_updated is the only field on a Report instance that is retrieved from GitHub (rather
-        # than being entered manually in the Report admin). As it is rendered in the template before
-        # the processed html content, we need to be have refreshed the fetched GitHub data at the
-        # point that the field it rendered, otherwise the pre-fetched (possibly stale) date will be
-        # rendered and cached in the template.
-        return self.report.last_updated
+        # bypass the request cache, which would answer in place of GitHub
+        client = GithubClient(use_cache=False) if self.use_cache else self.client
+        headers = dict(client.headers)
+        if etag:
+            headers["If-None-Match"] = etag
+
+        # osgithub's requests have no timeout, so the request is made directly, and the
+        # repo is only used for its path rather than fetched
+        repo = GithubRepo(client=client, owner="opensafely", name=self.report.repo)
+        response = client.session.get(
+            "/".join([client.base_url, *repo.repo_path_segments, "commits"]),
+            headers=headers,
+            params={
+                "sha": self.report.branch,
+                "path": self.report.report_html_file_path,
+                "per_page": 1,
+            },
+            timeout=CHECK_TIMEOUT,
+        )
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        last_commit_date = response.json()[0]["commit"]["committer"]["date"]
+        last_updated = datetime.fromisoformat(last_commit_date)
+        return (
+            response.headers.get("ETag", ""),
+            response.headers.get("Last-Modified", ""),
+            last_updated,
+        )
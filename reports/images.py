@@ -0,0 +1,56 @@
+"""
+Images extracted from report HTML
+
+Notebook exports embed their plots as base64 encoded `data:` URIs, which can make up
+most of a report's size.  When EXTRACT_REPORT_IMAGES is on, process_html moves them into
+files named by the hash of their content, so unchanged plots are stored once, and served
+with headers that let browsers cache them forever, across versions of a report.
+"""
+
+import base64
+import binascii
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+
+IMAGE_DIRECTORY = "report-images"
+
+# Only raster images are extracted; SVGs can contain scripts, which would run if one
+# were opened directly from our domain
+EXTENSIONS = {
+    "image/gif": "gif",
+    "image/jpeg": "jpeg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+
+def image_path(name):
+    return f"{IMAGE_DIRECTORY}/{name}"
+
+
+def extract_image(data_uri):
+    """
+    Store the image in a base64 encoded `data:` URI, and return its URL
+
+    Returns None, leaving the image to be served inline, if the URI isn't an image of a
+    type in EXTENSIONS, or isn't valid base64.
+    """
+    if not data_uri.startswith("data:"):
+        return None
+    header, _, data = data_uri.partition(",")
+    content_type, _, encoding = header.removeprefix("data:").partition(";")
+    if content_type not in EXTENSIONS or encoding != "base64":
+        return None
+    try:
+        content = base64.b64decode("".join(data.split()), validate=True)
+    except binascii.Error:
+        return None
+
+    name = f"{hashlib.sha256(content).hexdigest()}.{EXTENSIONS[content_type]}"
+    if not default_storage.exists(image_path(name)):
+        default_storage.save(image_path(name), ContentFile(content))
+    return reverse("report_image", kwargs={"name": name})
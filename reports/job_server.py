@@ -1,18 +1,96 @@
+import codecs
+import itertools
+import threading
 from datetime import datetime
 
 import requests
 import requests_cache
 from environs import Env
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .remote import RemoteReport
 
 
 env = Env()
 
+# Sessions shared by every JobServerClient in this process, keyed by their caching
+# options, so that connections to job-server (and the request cache's database) are
+# reused between requests rather than being opened for each one
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def parse_last_modified(header):
+    """
+    Parse a Last-Modified header into a datetime object, to avoid implicit coercion
+    elsewhere
+    """
+    rfc_7231_date_format = "%a, %d %b %Y %H:%M:%S %Z"
+    return datetime.strptime(header, rfc_7231_date_format)
+
+
+class FileTooLarge(Exception):
+    def __init__(self, url, size):
+        super().__init__(
+            f"{url} is larger than the maximum of {JobServerClient.max_file_size} "
+            f"bytes ({size} bytes)"
+        )
+
+
+def _build_session(use_cache, expire_after, urls_expire_after):
+    if use_cache:
+        session = requests_cache.CachedSession(
+            backend="sqlite",
+            cache_name=JobServerClient.cache_name,
+            expire_after=expire_after,
+            urls_expire_after=urls_expire_after,
+        )
+    else:
+        session = requests.Session()
+
+    # Retry idempotent requests that fail to connect or hit a job-server deploy,
+    # returning the last response once retries are exhausted so that callers handle
+    # it as before
+    retry = Retry(
+        total=JobServerClient.max_retries,
+        backoff_factor=0.5,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["HEAD", "GET"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=JobServerClient.pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    session.headers = {"User-Agent": JobServerClient.user_agent}
+    return session
+
+
+def get_session(use_cache=False, expire_after=-1, urls_expire_after=None):
+    """Return this process's shared session for the given caching options"""
+    key = (use_cache, expire_after, tuple(sorted((urls_expire_after or {}).items())))
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = _build_session(use_cache, expire_after, urls_expire_after)
+        return _sessions[key]
+
+
+def close_sessions():
+    """Close and forget this process's shared sessions"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
 
 class JobServerClient:
     """
     A connection to the Jobs site
 
-    Optionally uses request caching
+    Optionally uses request caching, for everything but downloading files.  Clients
+    share a pooled session with others in the same process that use the same caching
+    options.
 
     Attributes:
         user_agent (str): set from JOB_SERVER_USER_AGENT environment variable;
@@ -30,89 +108,148 @@ class JobServerClient:
 
     cache_name = env.str("REQUESTS_CACHE_NAME", default="http_cache")
     user_agent = env.str("JOB_SERVER_USER_AGENT", default="reports")
+    pool_size = env.int("JOB_SERVER_POOL_SIZE", default=10)
+    max_retries = env.int("JOB_SERVER_MAX_RETRIES", default=3)
+    # seconds to wait to connect, and between bytes received, when getting files
+    connect_timeout = env.float("JOB_SERVER_CONNECT_TIMEOUT", default=3.05)
+    read_timeout = env.float("JOB_SERVER_READ_TIMEOUT", default=30)
+    max_file_size = env.int("JOB_SERVER_MAX_FILE_SIZE", default=50 * 1024 * 1024)
+    chunk_size = 64 * 1024
 
     def __init__(
         self, use_cache=False, token=None, expire_after=-1, urls_expire_after=None
     ):
-        if use_cache:
-            self.session = requests_cache.CachedSession(
-                backend="sqlite",
-                cache_name=self.cache_name,
-                expire_after=expire_after,
-                urls_expire_after=urls_expire_after,
-            )
-        else:
-            self.session = requests.Session()
+        self.session = get_session(
+            use_cache=use_cache,
+            expire_after=expire_after,
+            urls_expire_after=urls_expire_after,
+        )
+        # Files are always streamed straight from job-server.  The request cache reads
+        # and stores a response's whole body before returning it, so a file could be
+        # larger than max_file_size by the time its size was checked, and would then be
+        # served from the cache for every later request.
+        self.file_session = get_session(use_cache=False)
 
         # always set a token, even if we're getting published outputs to simply
-        # the code on either side.
+        # the code on either side.  It's sent with each request, rather than set on
+        # the shared session.
         token = token or env.str("JOB_SERVER_TOKEN", default=None)
-        self.session.headers = {
-            "User-Agent": self.user_agent,
-            "Authorization": token,
-        }
+        self.headers = {"Authorization": token}
 
     def file_exists(self, url):
-        return self.session.head(url, allow_redirects=True).ok
+        return self.session.head(url, headers=self.headers, allow_redirects=True).ok
 
     def get_file(self, url):
-        r = self.session.get(url, allow_redirects=True, timeout=1)
+        with self.file_session.get(
+            url,
+            headers=self.headers,
+            allow_redirects=True,
+            timeout=(self.connect_timeout, self.read_timeout),
+            stream=True,
+        ) as r:
+            r.raise_for_status()
+            content = self._read_text(r, url)
+
+        return content, parse_last_modified(r.headers.get("Last-Modified"))
+
+    def check_file(self, url, etag="", last_modified=""):
+        """
+        Check whether a file has changed with a conditional HEAD request
+
+        Returns None if it is unchanged since the response that `etag` and
+        `last_modified` were taken from, otherwise a tuple of its ETag and
+        Last-Modified headers and the datetime it was last modified.
+        """
+        conditional_headers = {}
+        if etag:
+            conditional_headers["If-None-Match"] = etag
+        if last_modified:
+            conditional_headers["If-Modified-Since"] = last_modified
+
+        r = self.session.head(
+            url,
+            headers={**self.headers, **conditional_headers},
+            allow_redirects=True,
+            timeout=(self.connect_timeout, self.read_timeout),
+        )
+        if r.status_code == 304:
+            return None
         r.raise_for_status()
 
-        # parse the header into a datetime object to avoid implicit coercion elsewhere
-        rfc_7231_date_format = "%a, %d %b %Y %H:%M:%S %Z"
-        last_updated = datetime.strptime(
-            r.headers.get("Last-Modified"),
-            rfc_7231_date_format,
+        new_etag = r.headers.get("ETag", "")
+        new_last_modified = r.headers.get("Last-Modified", "")
+        # not every server answers conditional HEAD requests with a 304
+        if conditional_headers and (new_etag, new_last_modified) == (
+            etag,
+            last_modified,
+        ):
+            return None
+        return new_etag, new_last_modified, parse_last_modified(new_last_modified)
+
+    def _read_text(self, response, url):
+        """
+        Download and decode a streamed response's body, refusing bodies larger than
+        max_file_size
+
+        Chunks are decoded as they arrive, so the raw bytes of the whole body are never
+        held alongside the decoded text.
+        """
+        content_length = int(response.headers.get("Content-Length") or 0)
+        if content_length > self.max_file_size:
+            raise FileTooLarge(url, content_length)
+
+        # Fall back to detecting the encoding from the start of the body, rather
+        # than the whole body as Response.text would
+        chunks = response.iter_content(chunk_size=self.chunk_size)
+        first_chunk = next(chunks, b"")
+        encoding = (
+            response.encoding
+            or requests.compat.chardet.detect(first_chunk)["encoding"]
+            or "utf-8"
         )
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
 
-        return r.text, last_updated
+        size = 0
+        text = []
+        for chunk in itertools.chain([first_chunk], chunks):
+            size += len(chunk)
+            if size > self.max_file_size:
+                raise FileTooLarge(url, size)
+            text.append(decoder.decode(chunk))
+        text.append(decoder.decode(b"", final=True))
+        return "".join(text)
 
 
-class JobServerReport:
+class JobServerReport(RemoteReport):
     """
     A class for interacting with an HTML file associated with a single Report
     instance, hosted as an output on the Jobs site.
     """
 
     def __init__(self, report, use_cache=True):
+        super().__init__(report)
         self.client = JobServerClient(use_cache=use_cache)
-        self.report = report
 
     def clear_cache(self):
         """Clear the cache for the Report's job-server URL"""
         if hasattr(self.client.session, "cache"):
-            self.client.session.cache.delete(urls=[self.report.job_server_url])
+            url = self.report.job_server_url
+            # only HEAD requests are cached now, but delete any GET cached before then
+            self.client.session.cache.delete(
+                urls=[url], requests=[requests.Request("HEAD", url).prepare()]
+            )
 
     def file_exists(self):
         return self.client.file_exists(self.report.job_server_url)
 
-    def get_html(self):
-        """
-        Fetches a report html file (an exported jupyter notebook) from a
-        job-server output URL based on `report`, a Report model instance.
-        """
-        content, last_updated = self.client.get_file(self.report.job_server_url)
+    def fetch(self):
+        return self.client.get_file(self.report.job_server_url)
 
-        # update Report.last_updated (a datetime.date) if the file on
-        # job-server has been updated
-        job_server_last_updated = last_updated.date()
-        if self.report.last_updated != job_server_last_updated:
-            self.report.last_updated = job_server_last_updated
-            self.report.save()
-
-        return content
+    def check(self, etag, last_modified):
+        # bypass the request cache, which would answer in place of job-server
+        client = JobServerClient(use_cache=False)
+        return client.check_file(self.report.job_server_url, etag, last_modified)
 
     @property
     def is_published(self):
         return "published" in self.report.job_server_url
-
-    def last_updated(self):
-        """
-        Return the last updated date separately to the fully processed HTML
-
-        This mirrors GitHubReport.last_updated so we can use a consistent API
-        in the template.
-        """
-        self.get_html()
-        return self.report.last_updated
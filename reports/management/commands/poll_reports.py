@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import structlog
+from django.core.management.base import BaseCommand
+
+from reports.models import Report
+from reports.rendering import get_remote, get_render, prune_renders, render_report
+
+
+logger = structlog.getLogger()
+
+
+class Command(BaseCommand):
+    help = """
+        Check every report's hosted file for changes with a conditional request, and
+        refresh the cache token and re-render only those reports whose file has changed.
+    """  # noqa: A003
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Maximum number of reports to check at the same time",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running, checking reports for changes every interval",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=300,
+            help="Seconds to wait between checks when watching",
+        )
+
+    def handle(self, *args, workers=8, watch=False, interval=300, **options):
+        if not watch:
+            self.poll_reports(workers=workers)
+            return
+
+        while True:
+            try:
+                self.poll_reports(workers=workers)
+            except Exception:
+                # keep watching; nothing supervises this command in production
+                logger.exception("Polling reports failed")
+            time.sleep(interval)
+
+    def poll_reports(self, workers=8):
+        # the remotes are only used to check for changes, which bypasses the request
+        # cache, so they don't each need a cached session of their own
+        remotes = [
+            get_remote(report, use_cache=False) for report in Report.objects.all()
+        ]
+
+        # Checks are network-bound so are made concurrently, but the results are
+        # saved, and changed reports rendered, from this thread only
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            checks = {
+                executor.submit(
+                    remote.check,
+                    remote.report.source_etag,
+                    remote.report.source_last_modified,
+                ): remote
+                for remote in remotes
+            }
+            for check in as_completed(checks):
+                remote = checks[check]
+                try:
+                    self.record_check(remote, check.result())
+                except Exception:
+                    # one unreachable report shouldn't stop the rest from being checked
+                    logger.exception(
+                        "Report source check failed",
+                        report_id=remote.report.pk,
+                        slug=remote.report.slug,
+                    )
+
+    def record_check(self, remote, result):
+        """Save the result of checking a report's file, and refresh it if it changed"""
+        first_check = not (
+            remote.report.source_etag or remote.report.source_last_modified
+        )
+        changed = remote.record_check(result)
+        # a report checked for the first time (as every report is after this command is
+        # first deployed) only records the file's validators, unless the file's date has
+        # changed or the report has no render
+        if changed or (first_check and get_render(remote.report) is None):
+            self.refresh_report(remote.report)
+
+    def refresh_report(self, report):
+        """
+        Refresh a changed report's cache token and render it
+
+        The new token is only saved once it has been rendered, so the report page
+        keeps serving the previous render until the new one is ready.
+        """
+        report.refresh_cache_token(commit=False)
+        try:
+            render_report(report)
+        except Exception:
+            # report_view will schedule another attempt once the token is saved
+            logger.exception(
+                "Report render failed", report_id=report.pk, slug=report.slug
+            )
+        report.save(update_fields=["cache_token"])
+        # once the new token has a render, the old token's renders can't be served
+        prune_renders(report)
+        self.stdout.write(f"Refreshed report '{report.slug}'")
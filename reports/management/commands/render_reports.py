@@ -0,0 +1,69 @@
+import time
+
+import structlog
+from django.core.management.base import BaseCommand
+
+from reports.models import Report
+from reports.rendering import (
+    acquire_render_lock,
+    get_render,
+    prune_renders,
+    release_render_lock,
+    render_report,
+)
+
+
+logger = structlog.getLogger()
+
+
+class Command(BaseCommand):
+    help = """
+        Fetch and process the HTML for every report that doesn't have a render for its
+        current cache token, so that report pages never have to do it inline, and
+        delete renders that are no longer needed.
+    """  # noqa: A003
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-render all reports, even those that already have a current render",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running, rendering reports as their cache tokens are refreshed",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=30,
+            help="Seconds to wait between checks for reports to render when watching",
+        )
+
+    def handle(self, *args, force=False, watch=False, interval=30, **options):
+        self.render_reports(force=force)
+        while watch:
+            time.sleep(interval)
+            self.render_reports()
+
+    def render_reports(self, force=False):
+        for report in Report.objects.all():
+            if not force and get_render(report) is not None:
+                continue
+            if not acquire_render_lock(report.pk, report.cache_token):
+                self.stdout.write(f"Report '{report.slug}' is already being rendered")
+                continue
+            try:
+                render_report(report)
+            except Exception:
+                # one broken report shouldn't stop the rest from being rendered
+                logger.exception(
+                    "Report render failed", report_id=report.pk, slug=report.slug
+                )
+                continue
+            finally:
+                release_render_lock(report.pk, report.cache_token)
+            self.stdout.write(f"Rendered report '{report.slug}'")
+
+        prune_renders()
@@ -1,3 +1,15 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (
+    cc_delim_re,
+    get_cache_key,
+    get_conditional_response,
+    learn_cache_key,
+)
+
+from .page_cache import page_cache_generation
+
+
 class XSSFilteringMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -8,3 +20,54 @@ class XSSFilteringMiddleware:
         response.headers.setdefault("X-XSS-Protection", "1; mode=block")
 
         return response
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Serve whole pages to anonymous users from the cache, for up to PAGE_CACHE_SECONDS
+
+    GET requests without a session cookie, which can't be from a logged in user, are
+    served from and stored in the cache.  Only successful responses that don't set
+    cookies and whose Cache-Control allows public caching are stored.  Pages are keyed on
+    the page cache generation, so they are never served after a change to what they
+    display, and on the release, so they are never served with the asset URLs of a
+    previous deploy.  Does nothing if PAGE_CACHE_SECONDS is 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timeout = settings.PAGE_CACHE_SECONDS
+        if (
+            not timeout
+            or request.method != "GET"
+            or settings.SESSION_COOKIE_NAME in request.COOKIES
+        ):
+            return self.get_response(request)
+
+        key_prefix = f"page-cache:{settings.RELEASE}:{page_cache_generation()}"
+        cache_key = get_cache_key(request, key_prefix, cache=cache)
+        response = cache.get(cache_key) if cache_key is not None else None
+        if response is not None:
+            return get_conditional_response(
+                request, etag=response.get("ETag"), response=response
+            )
+
+        response = self.get_response(request)
+        if self.is_cacheable(response):
+            cache_key = learn_cache_key(request, response, timeout, key_prefix, cache)
+            cache.set(cache_key, response, timeout)
+        return response
+
+    def is_cacheable(self, response):
+        directives = {
+            directive.split("=")[0].strip().lower()
+            for directive in cc_delim_re.split(response.get("Cache-Control", ""))
+        }
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and "public" in directives
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.15 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0036_rendered_report"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="report",
+            name="source_etag",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="report",
+            name="source_last_modified",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.15 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0037_report_source_validators"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="renderedreport",
+            name="html_crc32",
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="renderedreport",
+            name="html_deflate",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name="renderedreport",
+            name="html_length",
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+    ]
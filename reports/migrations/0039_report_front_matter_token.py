@@ -0,0 +1,19 @@
+# Generated by Django 5.2.15 on 2026-10-18 03:20
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0038_rendered_report_compressed_html"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="report",
+            name="front_matter_token",
+            field=models.UUIDField(default=uuid.uuid4),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.15 on 2026-10-18 03:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_report_activity(apps, schema_editor):
+    # the same as reports.activity.update_report_activity, for every report
+    Report = apps.get_model("reports", "Report")
+    ReportActivity = apps.get_model("reports", "ReportActivity")
+
+    activities = []
+    for report in Report.objects.select_related("category"):
+        published, updated = report.publication_date, report.last_updated
+        if updated is None or updated == published:
+            activity, activity_date = "published", published
+        elif updated > published:
+            activity, activity_date = "updated", updated
+        else:
+            continue
+        activities.append(
+            ReportActivity(
+                report=report,
+                activity=activity,
+                activity_date=activity_date,
+                is_draft=report.is_draft,
+                is_archived=report.category.name.casefold() == "archive",
+            )
+        )
+    ReportActivity.objects.bulk_create(activities)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0039_report_front_matter_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportActivity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "activity",
+                    models.CharField(
+                        choices=[("published", "Published"), ("updated", "Updated")],
+                        max_length=9,
+                    ),
+                ),
+                ("activity_date", models.DateField()),
+                ("is_draft", models.BooleanField()),
+                ("is_archived", models.BooleanField()),
+                (
+                    "report",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="latest_activity",
+                        to="reports.report",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "report activity",
+                "default_permissions": (),
+                "indexes": [
+                    models.Index(
+                        fields=["is_archived", "is_draft", "-activity_date"],
+                        name="report_activity_feed",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            populate_report_activity, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.15 on 2026-10-18 03:29
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0040_report_activity"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(
+                django.db.models.functions.text.Upper("name"),
+                name="category_name_upper",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                condition=models.Q(("is_draft", False)),
+                fields=["menu_name"],
+                name="report_published_menu_name",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                condition=models.Q(("is_draft", False)),
+                fields=["category"],
+                name="report_published_category",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(fields=["job_server_url"], name="report_job_server_url"),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.15 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0041_hot_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="report",
+            name="report_published_menu_name",
+        ),
+        migrations.RemoveIndex(
+            model_name="reportactivity",
+            name="report_activity_feed",
+        ),
+        migrations.AddIndex(
+            model_name="reportactivity",
+            index=models.Index(
+                condition=models.Q(("is_archived", False)),
+                fields=["-activity_date"],
+                name="report_activity_recent",
+            ),
+        ),
+    ]
@@ -4,6 +4,7 @@ from uuid import uuid4
 import structlog
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Upper
 from django.forms.models import model_to_dict
 from django.urls import reverse
 from django.utils import timezone
@@ -16,6 +17,7 @@ from osgithub import GithubAPIException, GithubRepo
 
 from .github import GithubReport
 from .job_server import JobServerReport
+from .visibility import user_visibility
 
 
 env = Env()
@@ -66,7 +68,7 @@ class PopulatedCategoryManager(models.Manager):
         queryset = (
             self.get_queryset().filter(id__in=report_category_ids).order_by("name")
         )
-        if user.is_staff:
+        if user_visibility(user).is_staff:
             return queryset
         return queryset.exclude(name__iexact="archive")
 
@@ -79,6 +81,11 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = "categories"
         ordering = ("name",)
+        indexes = [
+            # for name__iexact lookups (e.g. of the archive category), which compare
+            # upper-cased names on PostgreSQL
+            models.Index(Upper("name"), name="category_name_upper"),
+        ]
 
     def __str__(self):
         return self.name
@@ -104,7 +111,7 @@ class ReportManager(models.Manager):
 
     def for_user(self, user):
         queryset = self.get_queryset()
-        if user.has_perm("reports.view_draft"):
+        if user_visibility(user).can_view_drafts:
             return queryset
         return queryset.filter(is_draft=False)
 
@@ -173,10 +180,19 @@ class Report(models.Model):
         help_text="File last modified date; autopopulated from the file origin",
         verbose_name="Last released",
     )
+    # Identifies the version of the report's hosted file; a new token means it must be
+    # fetched and rendered again
     cache_token = models.UUIDField(default=uuid4)
+    # Identifies the version of the front matter (the fields and links shown in the
+    # report's header), which can change without the hosted file being fetched again
+    front_matter_token = models.UUIDField(default=uuid4)
     # Flag to remember if this report needed to use the git blob method (see github.py),
     # to avoid re-calling the contents endpoint if we know it will fail
     use_git_blob = models.BooleanField(default=False)
+    # ETag and Last-Modified headers from the last check of the file's host for
+    # changes (see remote.py), sent back to it in the next check
+    source_etag = models.CharField(max_length=255, blank=True, default="")
+    source_last_modified = models.CharField(max_length=64, blank=True, default="")
     is_draft = models.BooleanField(
         default=True,
         help_text="Draft reports are only visible by a logged in user with relevant permissions",
@@ -204,8 +220,27 @@ class Report(models.Model):
         related_name="reports_updated",
     )
 
+    # Fields that are set from the report's hosted file when it is fetched, rather
+    # than entered in the Report admin
+    REMOTE_FIELDS = {
+        "last_updated",
+        "use_git_blob",
+        "source_etag",
+        "source_last_modified",
+    }
+
     class Meta:
         ordering = ("menu_name",)
+        indexes = [
+            # published reports, by category, for building the navigation tree
+            models.Index(
+                fields=["category"],
+                condition=models.Q(is_draft=False),
+                name="report_published_category",
+            ),
+            # HostingFilter in the admin
+            models.Index(fields=["job_server_url"], name="report_job_server_url"),
+        ]
         permissions = [
             ("view_draft", "Can view draft reports"),
         ]
@@ -227,7 +262,14 @@ class Report(models.Model):
                 JobServerReport(self).clear_cache()
 
         if commit:
-            self.save()
+            self.save(update_fields=["cache_token"])
+
+    def refresh_front_matter_token(self, commit=True):
+        """Refresh the front matter token to invalidate the cached report header"""
+        self.front_matter_token = uuid4()
+
+        if commit:
+            self.save(update_fields=["front_matter_token"])
 
     @property
     def meta_title(self):
@@ -357,44 +399,62 @@ class Report(models.Model):
 
     @classmethod
     def from_db(cls, db, field_names, values):
-        """Extended from_db method to store original field values on the instance"""
+        """
+        Extended from_db method to store original field values on the instance
+
+        Only the report's own fields are stored, so loading reports doesn't cost any extra
+        queries; changes to a report's links refresh its front matter token in Link.save()
+        and Link.delete().
+        """
         instance = super().from_db(db, field_names, values)
         instance._loaded_values = dict(zip(field_names, values))
-        instance._loaded_values["links"] = {
-            link.pop("id"): link for link in instance.links.values()
-        }
         return instance
 
     def _check_and_refresh_cache(self):
         requests_cache_fields = {"repo", "branch", "report_html_file_path"}
+        # job-server responses are cached by URL, so a new URL needs no cache clearing
+        source_fields = requests_cache_fields | {"job_server_url"}
         # exclude fields that are autopopulated or irrelevant for http caching from the check
         exclude_fields = {
             "id",
             "slug",
             "cache_token",
-            "last_updated",
-            "use_git_blob",
+            "front_matter_token",
             "is_draft",
-            "links",
+            *self.REMOTE_FIELDS,
         }
         all_field_keys = self._loaded_values.keys()
-        http_cache_fields = set(all_field_keys) - requests_cache_fields - exclude_fields
-        if any(
-            getattr(self, field) != self._loaded_values[field]
-            for field in requests_cache_fields
-        ):
+        front_matter_fields = set(all_field_keys) - source_fields - exclude_fields
+
+        def changed(fields):
+            return any(
+                getattr(self, field) != self._loaded_values[field] for field in fields
+            )
+
+        if changed(requests_cache_fields):
             logger.info(
                 "Source repo field(s) updated; refreshing cache token and clearing requests cache"
             )
             self.refresh_cache_token(commit=False)
-        elif any(
-            getattr(self, field) != self._loaded_values[field]
-            for field in http_cache_fields
-        ):
-            logger.info("Non-repo field(s) updated; refreshing cache token only")
+        elif changed(source_fields):
+            logger.info("Source URL updated; refreshing cache token only")
             self.refresh_cache_token(refresh_http_cache=False, commit=False)
 
+        if changed(front_matter_fields):
+            logger.info("Front matter field(s) updated; refreshing front matter token")
+            self.refresh_front_matter_token(commit=False)
+
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) <= (
+            self.REMOTE_FIELDS | {"cache_token", "front_matter_token"}
+        ):
+            # Only fields derived from the report's hosted file, or its cache tokens, are
+            # being saved; they need no validation (which would call the remote host
+            # again) and don't affect caching or links.
+            super().save(*args, **kwargs)
+            return
+
         # If updating an existing instance, check fields changed and refresh cache if required
         # For an existing instance, `from_db` will be called when the instance is retrieved from the database, and initial
         # values stored on the instance. When we call save, we will have the _loaded_values attribute.  If this save is
@@ -468,15 +528,15 @@ class Link(models.Model):
 
     def save(self, *args, **kwargs):
         # For links added or edited after a report's initial save, check if the link has changed and refresh the report's
-        # cache token.
+        # front matter token.
         # On a report's initial save, a Link for the repo url is generated; at this point the report has no links yet, and
         # we don't need to check if the cache refresh is required as we know the report is new
         report_has_links_pre_save = self.report.links.exists()
 
-        # Save the link first before updating the cache.  `refresh_cache_token` will call
+        # Save the link first before updating the cache.  `refresh_front_matter_token` will call
         # save() on the report, which we don't want to happen before this link is saved in case this
         # link is the result of the re-creation of a source repo link within the report's save
-        # We DO still want to refresh the cache token in that case, though, so that the new
+        # We DO still want to refresh the front matter token in that case, though, so that the new
         # repo link shows up on the site
         super().save(*args, **kwargs)
 
@@ -484,18 +544,116 @@ class Link(models.Model):
             initial_report_links = self.report.links.all()
             this_link = initial_report_links.filter(id=self.id)
             if not this_link.exists():  # pragma: no cover
-                logger.info("Link added to report; refreshing report cache token")
-                self.report.refresh_cache_token()
+                logger.info(
+                    "Link added to report; refreshing report front matter token"
+                )
+                self.report.refresh_front_matter_token()
             else:
                 this_link_from_report = this_link.first()
                 if any(  # pragma: no cover
                     getattr(self, field) != value
                     for field, value in model_to_dict(this_link_from_report).items()
                 ):
-                    logger.info("Link updated; refreshing report cache token")
-                    self.report.refresh_cache_token()
+                    logger.info("Link updated; refreshing report front matter token")
+                    self.report.refresh_front_matter_token()
 
     def delete(self, *args, **kwargs):
-        logger.info("Link deleted; refreshing report cache token")
-        self.report.refresh_cache_token()
+        logger.info("Link deleted; refreshing report front matter token")
+        self.report.refresh_front_matter_token()
         super().delete(*args, **kwargs)
+
+
+class RenderedReport(models.Model):
+    """
+    A report's HTML, processed and ready to be served
+
+    Renders are keyed by a hash of the source HTML and the version of the renderer
+    that processed it, so reports (and cache tokens) whose source HTML hasn't changed
+    share the same render.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    renderer_version = models.PositiveIntegerField()
+    html = models.TextField()
+    # The html, UTF-8 encoded and compressed by compression.compress_fragment, ready to
+    # be spliced into a gzipped page; renders made before this was added don't have it
+    html_deflate = models.BinaryField(null=True)
+    html_crc32 = models.PositiveBigIntegerField(null=True)
+    html_length = models.PositiveBigIntegerField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # renders are managed by the rendering pipeline, not by users
+        default_permissions = ()
+
+    def __str__(self):
+        return self.content_hash
+
+    @property
+    def has_compressed_fragment(self):
+        # checked without loading the deferred html_deflate
+        return self.html_length is not None
+
+    @property
+    def compressed_fragment(self):
+        """The compressed html as a compression.compress_fragment tuple, if there is one"""
+        if self.html_deflate is None:
+            return None
+        return bytes(self.html_deflate), self.html_crc32, self.html_length
+
+
+class ReportRender(models.Model):
+    """The RenderedReport that was rendered for a Report's cache token"""
+
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name="renders")
+    cache_token = models.UUIDField()
+    rendered = models.ForeignKey(
+        RenderedReport, on_delete=models.CASCADE, related_name="report_renders"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["report", "cache_token"], name="unique_report_render"
+            )
+        ]
+        default_permissions = ()
+
+
+class ReportActivity(models.Model):
+    """
+    A report's most recent activity (its publication or its last update), as listed on
+    the landing page
+
+    Kept up to date from the report by reports.activity, along with copies of the
+    report's fields that decide who can see it, so that the landing page can find the
+    most recent activity with a single indexed query.
+    """
+
+    PUBLISHED = "published"
+    UPDATED = "updated"
+
+    report = models.OneToOneField(
+        Report, on_delete=models.CASCADE, related_name="latest_activity"
+    )
+    activity = models.CharField(
+        max_length=9, choices=((PUBLISHED, "Published"), (UPDATED, "Updated"))
+    )
+    activity_date = models.DateField()
+    is_draft = models.BooleanField()
+    is_archived = models.BooleanField()
+
+    class Meta:
+        default_permissions = ()
+        indexes = [
+            # recent_activity, most recent first.  Partial rather than composite, as
+            # Django compiles is_archived=False to "WHERE NOT is_archived", which
+            # SQLite only matches against an index with the same condition.
+            models.Index(
+                fields=["-activity_date"],
+                condition=models.Q(is_archived=False),
+                name="report_activity_recent",
+            )
+        ]
+        verbose_name_plural = "report activity"
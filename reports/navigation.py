@@ -0,0 +1,138 @@
+"""
+The sidebar navigation tree of report categories and reports
+
+Every page displays the tree, so it is built with a single query and cached for each
+class of user that can see a different set of reports.  The cached trees are keyed on a
+version, which changes whenever a change to a Report or Category is committed.
+"""
+
+from dataclasses import dataclass, field
+from itertools import groupby
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Report
+from .visibility import user_visibility
+
+
+# Users are grouped by whether they can see draft reports and whether they can see the
+# archive category; every user in a class sees the same navigation tree
+VISIBILITY_CLASSES = ["public", "drafts", "staff", "staff-drafts"]
+
+# Report fields displayed in the navigation tree
+NAV_REPORT_FIELDS = {"slug", "menu_name", "is_draft", "category"}
+
+
+@dataclass
+class NavReport:
+    id: int
+    menu_name: str
+    is_draft: bool
+    url: str
+
+    def get_absolute_url(self):
+        return self.url
+
+
+@dataclass
+class NavCategory:
+    id: int
+    name: str
+    reports: list[NavReport] = field(default_factory=list)
+
+
+def visibility_class(user):
+    """Return the name of the class of users whose navigation tree `user` sees"""
+    return user_visibility(user).name
+
+
+NAV_TREE_VERSION_CACHE_KEY = "nav-tree:version"
+
+
+def nav_tree_version():
+    """
+    Return a string that changes whenever the navigation trees do, for use in ETags
+    of pages that display them
+    """
+    version = cache.get(NAV_TREE_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(NAV_TREE_VERSION_CACHE_KEY, uuid4().hex, timeout=None)
+        # another process may have added its version first
+        version = cache.get(NAV_TREE_VERSION_CACHE_KEY)
+    return version
+
+
+def nav_tree_cache_key(visibility):
+    # A request that reads the tree's rows before a change is committed stores it under
+    # the version from before the change, so it is never served afterwards
+    return f"nav-tree:{nav_tree_version()}:{visibility}"
+
+
+def nav_tree_reports(visibility):
+    """Return the reports that a class of users sees in the navigation tree"""
+    reports = Report.objects.select_related("category").only(
+        "id", "slug", "menu_name", "is_draft", "category__id", "category__name"
+    )
+    if visibility not in ("drafts", "staff-drafts"):
+        reports = reports.filter(is_draft=False)
+    if visibility not in ("staff", "staff-drafts"):
+        reports = reports.exclude(category__name__iexact="archive")
+    return reports.order_by("category__name", "menu_name")
+
+
+def build_nav_tree(visibility):
+    """
+    Build the list of NavCategories, with their NavReports, that a class of users can see
+
+    Categories are ordered by name and only included if they contain at least one visible
+    report; reports are ordered by menu name.
+    """
+    return [
+        NavCategory(
+            id=category.id,
+            name=category.name,
+            reports=[
+                NavReport(
+                    id=report.id,
+                    menu_name=report.menu_name,
+                    is_draft=report.is_draft,
+                    url=report.get_absolute_url(),
+                )
+                for report in category_reports
+            ],
+        )
+        for category, category_reports in groupby(
+            nav_tree_reports(visibility), key=lambda report: report.category
+        )
+    ]
+
+
+def nav_tree_for_user(user):
+    visibility = visibility_class(user)
+    key = nav_tree_cache_key(visibility)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_nav_tree(visibility)
+        cache.set(key, tree, timeout=None)
+    return tree
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+def clear_nav_tree_cache(sender, update_fields=None, **kwargs):
+    if (
+        sender is Report
+        and update_fields is not None
+        and not NAV_REPORT_FIELDS & set(update_fields)
+    ):
+        # only fields that aren't displayed in the tree have changed
+        return
+    # wait for the change to be committed, as a tree built by another request before
+    # then would be cached without it under the new version
+    transaction.on_commit(lambda: cache.delete(NAV_TREE_VERSION_CACHE_KEY))
@@ -0,0 +1,43 @@
+"""
+Whole pages cached for anonymous users (see AnonymousPageCacheMiddleware)
+
+Cached pages are keyed on a generation, which changes whenever anything displayed on the
+site's pages is saved or deleted, so every cached page is dropped at once rather than
+each page having to be tracked down.
+"""
+
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Link, Org, Report
+
+
+PAGE_CACHE_GENERATION_KEY = "page-cache:generation"
+
+
+def page_cache_generation():
+    """Return the current generation of cached pages"""
+    generation = cache.get(PAGE_CACHE_GENERATION_KEY)
+    if generation is None:
+        # if another process starts a generation first, use theirs
+        cache.add(PAGE_CACHE_GENERATION_KEY, uuid4().hex, timeout=None)
+        generation = cache.get(PAGE_CACHE_GENERATION_KEY)
+    return generation
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+@receiver(post_save, sender=Org)
+@receiver(post_delete, sender=Org)
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+def start_page_cache_generation(sender, **kwargs):
+    # wait for the change to be committed, so that a page isn't cached for the new
+    # generation before it can see the change
+    transaction.on_commit(lambda: cache.delete(PAGE_CACHE_GENERATION_KEY))
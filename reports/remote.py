@@ -0,0 +1,83 @@
+from abc import ABC, abstractmethod
+
+
+class RemoteReport(ABC):
+    """
+    Base class for interacting with the HTML file associated with a single Report
+    instance, wherever it is hosted
+
+    Subclasses implement fetch(), which downloads the file, and check(), which checks
+    whether it has changed.  get_html() calls fetch() at most once per instance, so the
+    file is never downloaded twice for the same render.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        self._fetched_html = None
+
+    @abstractmethod
+    def fetch(self):
+        """
+        Download the report's html file
+
+        Returns a tuple of the file's content and the datetime it was last updated
+        """
+
+    @abstractmethod
+    def check(self, etag, last_modified):
+        """
+        Make a conditional request for the file's metadata, without downloading it
+
+        `etag` and `last_modified` are the validators returned by the previous check, if
+        any.  Returns None if the host reports the file is unchanged, otherwise a tuple
+        of its new ETag and Last-Modified headers and the datetime it was last updated.
+        """
+
+    def get_html(self):
+        """
+        Fetches a report html file (an exported jupyter notebook) based on `report`, a
+        Report model instance, and updates the report's last_updated date from it.
+        """
+        if self._fetched_html is None:
+            html, last_updated = self.fetch()
+            self._update_fields(last_updated=last_updated.date())
+            self._fetched_html = html
+        return self._fetched_html
+
+    def record_check(self, result):
+        """
+        Update the report from the result of check(), and return True if the file has
+        changed
+
+        This is separate from check() so that checks can be made concurrently while
+        the results are saved one at a time.
+
+        A report that has never been checked has no validators to send, so its file is
+        only treated as changed if the date it was last updated has changed.
+        """
+        if result is None:
+            return False
+
+        etag, last_modified, last_updated = result
+        first_check = not (self.report.source_etag or self.report.source_last_modified)
+        previously_updated = self.report.last_updated
+        self._update_fields(
+            last_updated=last_updated.date(),
+            source_etag=etag or "",
+            source_last_modified=last_modified or "",
+        )
+        if first_check:
+            return last_updated.date() != previously_updated
+        return True
+
+    def _update_fields(self, **values):
+        """Save any of the report's remote fields that have changed"""
+        changed = [
+            field
+            for field, value in values.items()
+            if getattr(self.report, field) != value
+        ]
+        for field in changed:
+            setattr(self.report, field, values[field])
+        if changed:
+            self.report.save(update_fields=changed)
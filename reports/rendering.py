@@ -1,26 +1,280 @@
-from bs4 import BeautifulSoup
+import hashlib
+import threading
+from datetime import timedelta
+from html import escape
+
+import lxml.html
+import structlog
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models, transaction
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from lxml.html.clean import Cleaner
 
+from .compression import compress_fragment
+from .github import GithubReport
+from .images import extract_image
+from .job_server import JobServerReport
+from .models import RenderedReport, Report, ReportRender
+
+
+logger = structlog.getLogger()
+
+# Bump this whenever a change to process_html changes its output, so that existing
+# renders are not reused for new ones
+RENDERER_VERSION = 2
+
+# renders which have been scheduled by this process and haven't finished yet,
+# keyed by (report pk, cache_token)
+_renders_in_flight = set()
+_renders_in_flight_lock = threading.Lock()
+
+# How long a render lock is held for if the process holding it dies before releasing it
+RENDER_LOCK_TIMEOUT = 10 * 60
+# How long to wait after a background render fails before trying it again
+RENDER_FAILURE_BACKOFF = 5 * 60
+
 
-def process_html(html):
+def process_html(html, extract_images=False):
     # We want to handle complete HTML documents and also fragments. We're going to extract the contents of the body
     # at the end of this function, but it's easiest to normalize to complete documents because that's what the
     # HTML-wrangling libraries we're using are most comfortable handling.
     if "<html>" not in html:
         html = f"<html><body>{html}</body></head>"
 
-    cleaned = Cleaner(page_structure=False, style=True, kill_tags=["head"]).clean_html(
-        html
-    )
-
-    soup = BeautifulSoup(cleaned, "html.parser")
+    # Everything is done on a single parsed tree, which is only serialised once at the end
+    document = lxml.html.document_fromstring(html)
+    Cleaner(page_structure=False, style=True, kill_tags=["head"])(document)
 
     # For small screens we want to allow side-scrolling for just a small number of elements. To enable this each one
     # needs to be wrapped in a div that we can target for styling.
-    for tag in ["table", "pre"]:
-        for element in soup.find_all(tag):
-            element.wrap(soup.new_tag("div", attrs={"class": "overflow-wrapper"}))
+    for element in list(document.iter("table", "pre")):
+        wrapper = document.makeelement("div", {"class": "overflow-wrapper"})
+        # the element's tail (the text following it) belongs after the wrapper
+        wrapper.tail, element.tail = element.tail, None
+        element.addprevious(wrapper)
+        wrapper.append(element)
+
+    # Move inline images into files that can be cached separately, and only loaded
+    # when they are scrolled to
+    if extract_images:
+        for image in document.iter("img"):
+            url = extract_image(image.get("src", ""))
+            if url is not None:
+                image.set("src", url)
+                image.set("loading", "lazy")
 
-    body_content = "".join([str(element) for element in soup.body.contents])
+    body = document.body
+    body_content = escape(body.text or "", quote=False) + "".join(
+        lxml.html.tostring(element, encoding="unicode") for element in body
+    )
     return mark_safe(body_content)
+
+
+def get_remote(report, use_cache=True):
+    """Return the "remote" class instance for wherever the report's HTML file is hosted"""
+    remote_cls = GithubReport if report.uses_github else JobServerReport
+    return remote_cls(report, use_cache=use_cache)
+
+
+def content_hash(html, extract_images=False):
+    """
+    Hash a report's source HTML along with the renderer version and options that will
+    process it
+    """
+    options = ":images" if extract_images else ""
+    return hashlib.sha256(f"{RENDERER_VERSION}{options}:{html}".encode()).hexdigest()
+
+
+def get_render(report):
+    """
+    Return the RenderedReport for the report's current cache_token, or None if it
+    hasn't been rendered yet
+
+    The html and its compressed copy are deferred, so that only the one that is
+    served is loaded, and neither is loaded if the page doesn't need rendering.
+    """
+    return (
+        RenderedReport.objects.filter(
+            report_renders__report=report,
+            report_renders__cache_token=report.cache_token,
+        )
+        .defer("html", "html_deflate")
+        .first()
+    )
+
+
+def get_stale_render(report):
+    """
+    Return the RenderedReport for the report's most recently rendered cache_token, or
+    None if it has never been rendered
+
+    This is served while the report's current cache_token is being rendered.  Renders
+    for old cache tokens are kept by prune_renders until there is a current one, at
+    which point it replaces them.
+    """
+    return (
+        RenderedReport.objects.filter(report_renders__report=report)
+        .order_by("-report_renders__created_at")
+        .defer("html", "html_deflate")
+        .first()
+    )
+
+
+def render_report(report):
+    """
+    Fetch a report's HTML file from wherever it is hosted, process it and store the
+    result against the report's cache_token, ready to be served by report_view
+
+    Processing is skipped if the source HTML has been rendered before (for this or
+    any other cache token or report) by the current renderer version.
+    """
+    # take the token before fetching; fetching can update (and save) the report
+    cache_token = report.cache_token
+    source_html = get_remote(report).get_html()
+
+    extract_images = settings.EXTRACT_REPORT_IMAGES
+    source_hash = content_hash(source_html, extract_images)
+    # the render is locked until it is linked to the report, so that prune_renders
+    # can't delete it as unused in the meantime
+    with transaction.atomic():
+        rendered = (
+            RenderedReport.objects.select_for_update()
+            .filter(content_hash=source_hash)
+            .first()
+        )
+        processed = rendered is None
+        if processed:
+            html = process_html(source_html, extract_images)
+            html_deflate, html_crc32, html_length = compress_fragment(html.encode())
+            rendered, _ = RenderedReport.objects.get_or_create(
+                content_hash=source_hash,
+                defaults={
+                    "renderer_version": RENDERER_VERSION,
+                    "html": html,
+                    "html_deflate": html_deflate,
+                    "html_crc32": html_crc32,
+                    "html_length": html_length,
+                },
+            )
+        ReportRender.objects.update_or_create(
+            report=report, cache_token=cache_token, defaults={"rendered": rendered}
+        )
+
+    logger.info(
+        "Report rendered",
+        report_id=report.pk,
+        slug=report.slug,
+        content_hash=rendered.content_hash,
+        processed=processed,
+    )
+    return mark_safe(rendered.html)
+
+
+def prune_renders(report=None):
+    """
+    Delete renders that can no longer be served, for just `report` if it is given
+
+    A report's renders for old cache tokens are only deleted once it has a render for
+    its saved current one, and RenderedReports are deleted once no report render uses
+    them.  RenderedReports that were created in the last RENDER_LOCK_TIMEOUT seconds, or
+    that render_report has locked to link to a report, are kept.
+    """
+    report_renders = ReportRender.objects.all()
+    if report is not None:
+        report_renders = report_renders.filter(report=report)
+    current_renders = ReportRender.objects.filter(
+        report=models.OuterRef("report"),
+        cache_token=models.OuterRef("report__cache_token"),
+    )
+    report_renders.filter(models.Exists(current_renders)).exclude(
+        cache_token=models.F("report__cache_token")
+    ).delete()
+    with transaction.atomic():
+        unused = (
+            RenderedReport.objects.filter(
+                report_renders__isnull=True,
+                created_at__lt=timezone.now() - timedelta(seconds=RENDER_LOCK_TIMEOUT),
+            )
+            .select_for_update(skip_locked=True, of=("self",))
+            .values_list("pk", flat=True)
+        )
+        RenderedReport.objects.filter(pk__in=list(unused)).delete()
+
+
+def render_lock_key(report_pk, cache_token):
+    return f"render-lock:{report_pk}:{cache_token}"
+
+
+def acquire_render_lock(report_pk, cache_token):
+    """
+    Take the lock on rendering a report's cache token, shared by every process using the
+    default cache, and return whether it was taken
+
+    Only the holder of the lock renders the token, so that a newly refreshed token is
+    rendered once rather than by every web worker and command that notices it missing.
+    """
+    return cache.add(
+        render_lock_key(report_pk, cache_token), True, timeout=RENDER_LOCK_TIMEOUT
+    )
+
+
+def release_render_lock(report_pk, cache_token):
+    cache.delete(render_lock_key(report_pk, cache_token))
+
+
+def render_failed_key(report_pk, cache_token):
+    return f"render-failed:{report_pk}:{cache_token}"
+
+
+def schedule_render(report):
+    """
+    Render a report in a background thread, so the request that noticed it was
+    missing doesn't have to wait for it
+
+    Does nothing if RENDER_REPORTS_IN_BACKGROUND is off, in which case rendering is
+    left entirely to the render_reports management command, if this or any other
+    process is already rendering the report's cache token, or if rendering it failed
+    within the last RENDER_FAILURE_BACKOFF seconds.
+    """
+    if not settings.RENDER_REPORTS_IN_BACKGROUND:
+        return
+
+    key = (report.pk, report.cache_token)
+    # a file that can't be fetched would otherwise be fetched again for every view
+    # of the report's placeholder page
+    if cache.get(render_failed_key(*key)):
+        return
+    with _renders_in_flight_lock:
+        if key in _renders_in_flight:
+            return
+        _renders_in_flight.add(key)
+
+    # another process is rendering it
+    if not acquire_render_lock(*key):
+        with _renders_in_flight_lock:
+            _renders_in_flight.discard(key)
+        return
+
+    thread = threading.Thread(
+        target=_render_in_background, args=(report.pk, key), daemon=True
+    )
+    thread.start()
+
+
+def _render_in_background(report_pk, key):
+    try:
+        # use a fresh instance rather than sharing the request's one across threads
+        report = Report.objects.get(pk=report_pk)
+        render_report(report)
+        prune_renders(report)
+    except Exception:
+        logger.exception("Background report render failed", report_id=report_pk)
+        cache.set(render_failed_key(*key), True, timeout=RENDER_FAILURE_BACKOFF)
+    finally:
+        release_render_lock(*key)
+        with _renders_in_flight_lock:
+            _renders_in_flight.discard(key)
+        # this thread's database connections won't be cleaned up by the request cycle
+        connections.close_all()
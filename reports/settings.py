@@ -66,9 +66,8 @@ MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    "django.middleware.cache.UpdateCacheMiddleware",
+    "reports.middleware.AnonymousPageCacheMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.cache.FetchFromCacheMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -202,12 +201,43 @@ initialise_sentry()
 INTERNAL_IPS = ["127.0.0.1"]
 
 # Caching
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
-        "LOCATION": "cache_table",
+# The cache is a table in the database by default.  CACHE_URL can point it elsewhere,
+# e.g. redis://host:6379/0, pymemcache://host:11211 (either of which needs its client
+# library installed), file:///path/to/dir or locmem:// for a cache local to each process.
+CACHES = {"default": env.dj_cache_url("CACHE_URL", default="db://cache_table")}
+# With CACHE_LOCAL_TIMEOUT set, each process keeps what it reads from that cache for up to
+# this many seconds, in front of it (see reports.cache)
+CACHE_LOCAL_TIMEOUT = env.int("CACHE_LOCAL_TIMEOUT", default=0)
+if CACHE_LOCAL_TIMEOUT:
+    CACHES["shared"] = CACHES["default"]
+    CACHES["default"] = {
+        "BACKEND": "reports.cache.TieredCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            "LOCAL_TIMEOUT": CACHE_LOCAL_TIMEOUT,
+            "LOCAL_MAX_ENTRIES": env.int("CACHE_LOCAL_MAX_ENTRIES", default=300),
+        },
     }
-}
+
+# Report rendering
+# Reports are rendered ahead of time by the render_reports management command.  When a
+# report is requested and has no render yet, it is rendered in a background thread in the
+# web process unless this is turned off, in which case rendering is left entirely to the
+# management command (e.g. `render_reports --watch`).
+RENDER_REPORTS_IN_BACKGROUND = env.bool("RENDER_REPORTS_IN_BACKGROUND", default=True)
+# Identifies the deployed code, so that report page ETags change when it does
+RELEASE = env.str("GITREF", default="unknown")
+# How long shared caches (e.g. a CDN) may serve public report pages before checking them
+REPORT_CACHE_SECONDS = env.int("REPORT_CACHE_SECONDS", default=300)
+# Move images embedded in reports as data: URIs into separate files in MEDIA_ROOT
+EXTRACT_REPORT_IMAGES = env.bool("EXTRACT_REPORT_IMAGES", default=False)
+# Stream report pages, sending the page header before the report body, rather than
+# sending each page in one go.  Streamed pages have no Content-Length and aren't stored
+# by the per-site cache middleware.
+STREAM_REPORT_PAGES = env.bool("STREAM_REPORT_PAGES", default=False)
+# Serve pages to anonymous users from the cache, for up to this many seconds (0 is off);
+# any change to a report, category, link or org drops every cached page
+PAGE_CACHE_SECONDS = env.int("PAGE_CACHE_SECONDS", default=0)
 
 
 # CSP
@@ -18,11 +18,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.auth.views import LoginView, LogoutView
-from django.urls import path
+from django.urls import path, re_path
 from django.views.generic import RedirectView
 
 from .forms import ReportsAuthenticationForm
-from .views import landing, report_view
+from .views import landing, report_image, report_view
 
 
 urlpatterns = [
@@ -38,6 +38,11 @@ urlpatterns = [
     path("logout/", LogoutView.as_view(), name="logout"),
     path("reports/", RedirectView.as_view(url="/", permanent=True)),
     path("reports/<slug:slug>/", report_view, name="report_view"),
+    re_path(
+        r"^report-images/(?P<name>[0-9a-f]{64}\.(?:gif|jpeg|png|webp))$",
+        report_image,
+        name="report_image",
+    ),
     path("", landing, name="landing"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
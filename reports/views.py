@@ -1,74 +1,101 @@
+from hashlib import sha256
+from uuid import uuid4
+
 import structlog
-from django.db.models import F, Q, Value
-from django.http import Http404
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
-from django.views.decorators.cache import never_cache
-
-from .github import GithubReport
-from .job_server import JobServerReport
+from django.utils.cache import (
+    add_never_cache_headers,
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import quote_etag
+from django.utils.safestring import mark_safe
+
+from .activity import recent_activity
+from .compression import (
+    GzipFragmentTemplateResponse,
+    accepts_gzip,
+    iter_gzip_around,
+)
+from .images import image_path
 from .models import Report
+from .navigation import nav_tree_version, visibility_class
+from .rendering import get_render, get_stale_render, schedule_render
 
 
 logger = structlog.getLogger()
 
 archive_category_name = "archive"
 
+# the size of the chunks that report html is streamed in
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
-@never_cache
 def landing(request):
     """Landing page for main site and post-login.  Displays recent Report activity"""
-    # We want the ten most recently published or updated outputs, without duplication. Until we've pulled them all
-    # back and compared their activity dates we don't know which ones we will be using, so we grab ten of each which
-    # must be enough.
-    all_reports = Report.objects.for_user(request.user).exclude(
-        category__name__iexact=archive_category_name
-    )
-
-    # To avoid duplication of reports in the activity list, we don't display the publication event for reports that
-    # have subsequently been updated. However if they are updated on the same day that they were published then we
-    # just consider that as a single publication event. The sum total of this is that we are only interested in
-    # publication dates where there has been no update or where the update date is the same as publication.
-    published = (
-        all_reports.filter(
-            Q(last_updated__isnull=True) | Q(publication_date__exact=F("last_updated")),
-        )
-        .order_by("-publication_date")[:10]
-        .annotate(activity=Value("published"), activity_date=F("publication_date"))
-    )
-
-    # As above, we ignore updates when they happen on the same day as publication.
-    updated = (
-        all_reports.filter(
-            last_updated__isnull=False,
-            last_updated__gt=F("publication_date"),
-        )
-        .order_by("-last_updated")[:10]
-        .annotate(activity=Value("updated"), activity_date=F("last_updated"))
-    )
-
-    # Merge the publish and update events and grab the ten most recent.
-    recent_activity = sorted(
-        [*published, *updated], key=lambda x: x.activity_date, reverse=True
-    )[:10]
+    # The ten most recently published or updated reports, each listed once; see reports.activity
     context = {
-        "recent_activity": recent_activity,
+        "recent_activity": recent_activity(request.user),
     }
-    return render(request, "landing.html", context)
+    response = render(request, "landing.html", context)
+    if request.user.is_authenticated:
+        add_never_cache_headers(response)
+    else:
+        # the page can be kept by the page cache, which is cleared whenever the reports
+        # change, but browsers and shared caches must fetch it again every time
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def report_etag(request, report, rendered, gzip):
+    """
+    Return an ETag for a report page, which changes whenever anything displayed on it
+    could have changed
+    """
+    user = request.user
+    parts = [
+        settings.RELEASE,
+        report.cache_token,
+        report.front_matter_token,
+        report.last_updated,
+        rendered.content_hash,
+        "gzip" if gzip else "identity",
+        visibility_class(user),
+        nav_tree_version(),
+        # logged in users see their own username in the page header
+        user.pk if user.is_authenticated else "anonymous",
+    ]
+    return quote_etag(sha256(":".join(map(str, parts)).encode()).hexdigest())
 
 
-@never_cache
 def report_view(request, slug):
     """
-    Fetches an html report file from github, and renders the style and body tags within
-    the report template page.  This entire view is never cached, however the template content is cached (in the template)
-    for 24 hours using the report's cache_token as a key, and can be forced to refetch and update the cache with the
-    `force-update` query parameter.
+    Renders a report's pre-rendered html within the report template page.
+
+    Report html is fetched and processed ahead of time (by the render_reports management command, or in the
+    background when a report is first requested) and stored against the report's cache_token, so this view never
+    fetches or processes html itself.  If there is no render for the current cache_token yet, a background render is
+    scheduled and the report's previous render is served, marked as stale, until it is ready; a report that has never
+    been rendered shows a placeholder instead.  The `force-update` query parameter refreshes the
+    cache_token, which forces a new render.
+
+    Rendered pages have an ETag, and a request whose If-None-Match matches it gets a 304 response before the page is
+    rendered.  Public reports viewed by anonymous users can be cached by shared caches for REPORT_CACHE_SECONDS;
+    everything else is private.  With STREAM_REPORT_PAGES on, rendered pages are streamed, so the page header is
+    sent before the report's html.
     """
+    # The org is shown in the report header and decides whether the report is_external.  Links are only read when the
+    # header isn't in the fragment cache, so aren't prefetched for every request.
     try:
         report = (
             Report.objects.for_user(request.user)
-            .select_related("category")
+            .select_related("category", "org")
             .get(slug=slug)
         )
     except Report.DoesNotExist:
@@ -82,19 +109,130 @@ def report_view(request, slug):
             report_id=report.pk,
             slug=report.slug,
         )
-        return redirect(report.get_absolute_url())
+        response = redirect(report.get_absolute_url())
+        add_never_cache_headers(response)
+        return response
+
+    # When the client accepts gzip, the render's pre-compressed html is spliced into a
+    # gzipped page rather than the page being served uncompressed
+    gzip = accepts_gzip(request)
+    rendered = get_render(report)
+    is_stale = False
+    if rendered is None:
+        schedule_render(report)
+        # serve the previous render, if there is one, until the new one is ready
+        rendered = get_stale_render(report)
+        is_stale = rendered is not None
+    else:
+        etag = report_etag(request, report, rendered, gzip)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            # a 304 carries the headers that the full response would have had
+            not_modified.headers["ETag"] = etag
+            patch_vary_headers(not_modified, ["Accept-Encoding"])
+            patch_report_cache_headers(request, report, not_modified)
+            return not_modified
 
-    remote_cls = GithubReport if report.uses_github else JobServerReport
-    remote = remote_cls(report)
     is_archived_report = report.category.name.casefold() == archive_category_name
 
-    response = TemplateResponse(
-        request,
-        "report.html",
-        {"remote": remote, "report": report, "is_archived_report": is_archived_report},
-    )
+    context = {
+        "report": report,
+        "is_archived_report": is_archived_report,
+        "is_stale": is_stale,
+    }
+    gzip = gzip and rendered is not None and rendered.has_compressed_fragment
+    if rendered is not None and settings.STREAM_REPORT_PAGES:
+        response = stream_report_page(request, context, rendered, gzip)
+    elif gzip:
+        response = GzipFragmentTemplateResponse(
+            request,
+            "report.html",
+            context,
+            "rendered_html",
+            rendered.compressed_fragment,
+        )
+    else:
+        context["rendered_html"] = mark_safe(rendered.html) if rendered else None
+        response = TemplateResponse(request, "report.html", context)
+        patch_vary_headers(response, ["Accept-Encoding"])
 
     if is_archived_report:
         response.headers["X-Robots-Tag"] = "noindex"
 
+    if rendered is None or is_stale:
+        # the placeholder page refreshes itself until the render is ready, and neither
+        # it nor a stale render should be kept by caches once it is
+        add_never_cache_headers(response)
+    else:
+        response.headers["ETag"] = etag
+        patch_report_cache_headers(request, report, response)
+
+    return response
+
+
+def stream_report_page(request, context, rendered, gzip):
+    """
+    Return a streaming response of a report page, which sends the page up to the report's html (the page shell,
+    navigation and report header) first, and then the html in chunks.  If `gzip` is set, the page is gzipped
+    around the render's compressed html, as with GzipFragmentTemplateResponse.
+
+    The render's html (or compressed html) is deferred, so isn't loaded until the start of the page has been sent.
+    """
+    marker = f"<!-- {uuid4().hex} -->"
+    page = render_to_string(
+        "report.html", {**context, "rendered_html": mark_safe(marker)}, request
+    )
+    prefix, suffix = (part.encode() for part in page.split(marker))
+
+    if gzip:
+        response = StreamingHttpResponse(
+            iter_gzip_around(
+                prefix,
+                lambda: rendered.compressed_fragment,
+                suffix,
+                chunk_size=STREAM_CHUNK_SIZE,
+            )
+        )
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+
+        def content():
+            yield prefix
+            html = rendered.html.encode()
+            for start in range(0, len(html), STREAM_CHUNK_SIZE):
+                yield html[start : start + STREAM_CHUNK_SIZE]
+            yield suffix
+
+        response = StreamingHttpResponse(content())
+
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def patch_report_cache_headers(request, report, response):
+    if report.is_draft or request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        # browsers check with us every time (cheaply, with If-None-Match), while
+        # shared caches can serve the page for a while
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=0,
+            s_maxage=settings.REPORT_CACHE_SECONDS,
+            must_revalidate=True,
+        )
+
+
+def report_image(request, name):
+    """
+    Serves an image extracted from a report's HTML
+
+    Images are named by the hash of their content, so can be cached forever.
+    """
+    path = image_path(name)
+    if not default_storage.exists(path):
+        raise Http404()
+    response = FileResponse(default_storage.open(path))
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
     return response
@@ -0,0 +1,40 @@
+"""
+Which reports a user can see
+
+Several things check this on every request (the report and category managers, the
+navigation tree and the landing page), so it is worked out once for each user object
+and kept on it, as Django's auth backends do with permissions.  request.user is a new
+object for each request, so each request works it out once.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Visibility:
+    # draft reports
+    can_view_drafts: bool
+    # the archive category, in the navigation tree and category lists
+    is_staff: bool
+
+    @property
+    def name(self):
+        """
+        The name of the class of users with this visibility, who all see the same
+        navigation tree
+        """
+        if self.is_staff:
+            return "staff-drafts" if self.can_view_drafts else "staff"
+        return "drafts" if self.can_view_drafts else "public"
+
+
+def user_visibility(user):
+    """Return what `user` can see"""
+    try:
+        return user._reports_visibility
+    except AttributeError:
+        user._reports_visibility = Visibility(
+            can_view_drafts=user.has_perm("reports.view_draft"),
+            is_staff=user.is_staff,
+        )
+        return user._reports_visibility
@@ -8,9 +8,11 @@ import structlog
 from django.contrib.auth.models import Permission
 from structlog.testing import LogCapture
 
+from reports.job_server import close_sessions
 from reports.models import Org
+from reports.rendering import render_report
 
-from .factories import UserFactory
+from .factories import ReportFactory, UserFactory
 
 
 @pytest.fixture
@@ -55,15 +57,19 @@ def fixture_log_output():
 
 @pytest.fixture(autouse=True)
 def fixture_configure_structlog(log_output):
-    structlog.configure(processors=[log_output])
+    # loggers mustn't be cached, or they would keep logging to the first module's capture
+    structlog.configure(processors=[log_output], cache_logger_on_first_use=False)
 
 
 @pytest.fixture
 def httpretty():
+    # don't reuse pooled job-server connections across real and mocked sockets
+    close_sessions()
     _httpretty.reset()
     _httpretty.enable()
     yield _httpretty
     _httpretty.disable()
+    close_sessions()
 
 
 @pytest.fixture
@@ -98,3 +104,13 @@ def skip_github_validation(reset_environment_after_test):
 def bennett_org():
     # we add this in migrations so can rely on it here
     return Org.objects.get(slug="bennett")
+
+
+@pytest.fixture
+def rendered_report(mocker, bennett_org):
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<h1>A rendered report</h1>"
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    report = ReportFactory(org=bennett_org, is_draft=False)
+    render_report(report)
+    return report
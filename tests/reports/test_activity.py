@@ -0,0 +1,101 @@
+from datetime import date
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+
+from reports.activity import recent_activity
+from reports.models import ReportActivity
+
+from ..factories import CategoryFactory, ReportFactory
+
+
+@pytest.mark.django_db
+def test_report_activity_follows_report(bennett_org):
+    report = ReportFactory(org=bennett_org, publication_date=date(2021, 1, 1))
+    activity = ReportActivity.objects.get(report=report)
+    assert (activity.activity, activity.activity_date) == (
+        "published",
+        date(2021, 1, 1),
+    )
+    assert not activity.is_draft
+    assert not activity.is_archived
+
+    # updated by a fetch of the report's file
+    report.last_updated = date(2021, 3, 1)
+    report.save(update_fields=["last_updated"])
+    activity.refresh_from_db()
+    assert (activity.activity, activity.activity_date) == ("updated", date(2021, 3, 1))
+
+    # saves of other fields leave it alone
+    ReportActivity.objects.update(activity_date=date(2000, 1, 1))
+    report.save(update_fields=["cache_token"])
+    activity.refresh_from_db()
+    assert activity.activity_date == date(2000, 1, 1)
+
+    report.is_draft = True
+    report.save()
+    activity.refresh_from_db()
+    assert activity.is_draft
+    assert activity.activity_date == date(2021, 3, 1)
+
+    # a report updated before it was published isn't listed
+    report.last_updated = date(2020, 1, 1)
+    report.save()
+    assert not ReportActivity.objects.filter(report=report).exists()
+
+
+@pytest.mark.django_db
+def test_report_activity_follows_category(bennett_org):
+    category = CategoryFactory(name="Old reports")
+    report = ReportFactory(org=bennett_org, category=category)
+
+    category.name = "Archive"
+    category.save()
+
+    assert ReportActivity.objects.get(report=report).is_archived
+
+
+@pytest.mark.django_db
+def test_recent_activity(bennett_org, user_with_permission, django_assert_num_queries):
+    published = ReportFactory(org=bennett_org, publication_date=date(2021, 1, 1))
+    updated = ReportFactory(
+        org=bennett_org,
+        publication_date=date(2021, 1, 1),
+        last_updated=date(2021, 2, 1),
+    )
+    draft = ReportFactory(
+        org=bennett_org, publication_date=date(2021, 3, 1), is_draft=True
+    )
+    ReportFactory(
+        org=bennett_org,
+        category=CategoryFactory(name="Archive"),
+        publication_date=date(2021, 4, 1),
+    )
+
+    with django_assert_num_queries(1):
+        activity = list(recent_activity(AnonymousUser()))
+    assert activity == [updated, published]
+    assert [report.activity for report in activity] == ["updated", "published"]
+    assert [report.activity_date for report in activity] == [
+        date(2021, 2, 1),
+        date(2021, 1, 1),
+    ]
+
+    assert list(recent_activity(user_with_permission)) == [draft, updated, published]
+    assert list(recent_activity(user_with_permission, limit=1)) == [draft]
+
+
+@pytest.mark.django_db
+def test_recent_activity_orders_reports_with_the_same_date(bennett_org):
+    reports = {
+        menu_name: ReportFactory(
+            org=bennett_org, menu_name=menu_name, publication_date=date(2021, 1, 1)
+        )
+        for menu_name in ["b", "c", "a"]
+    }
+
+    assert list(recent_activity(AnonymousUser())) == [
+        reports["a"],
+        reports["b"],
+        reports["c"],
+    ]
@@ -0,0 +1,105 @@
+import pytest
+from django.core.cache import caches
+
+from reports.cache import TieredCache
+
+
+@pytest.fixture
+def tiered(settings):
+    settings.CACHES = {
+        **settings.CACHES,
+        "shared": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "tiered-test",
+        },
+    }
+    cache = TieredCache("shared", {"OPTIONS": {"LOCAL_TIMEOUT": 5}})
+    yield cache
+    cache.clear()
+
+
+def test_tiered_cache_reads_through_to_shared_cache(tiered):
+    caches["shared"].set("key", "value")
+
+    assert tiered.get("key") == "value"
+    # the value is now kept locally
+    assert tiered.local.get("key") == "value"
+    assert tiered.get("missing", "default") == "default"
+
+
+def test_tiered_cache_caches_none(tiered):
+    tiered.set("key", None)
+    caches["shared"].delete("key")
+
+    assert tiered.get("key", "default") is None
+
+
+def test_tiered_cache_serves_local_copy(tiered):
+    tiered.set("key", "value")
+    # changed by another process
+    caches["shared"].set("key", "new value")
+
+    assert tiered.get("key") == "value"
+    tiered.local.clear()
+    assert tiered.get("key") == "new value"
+
+
+@pytest.mark.parametrize("timeout,local_timeout", [(None, 5), (60, 5), (2, 2)])
+def test_tiered_cache_local_timeout(tiered, mocker, timeout, local_timeout):
+    local_set = mocker.spy(tiered.local, "set")
+
+    tiered.set("key", "value", timeout)
+
+    local_set.assert_called_once_with("key", "value", local_timeout, None)
+
+
+def test_tiered_cache_add(tiered):
+    assert tiered.add("key", "value")
+    assert tiered.local.get("key") == "value"
+
+    # add always checks the shared cache
+    tiered.local.clear()
+    assert not tiered.add("key", "other value")
+    assert tiered.get("key") == "value"
+
+
+def test_tiered_cache_many(tiered):
+    tiered.set_many({"a": 1, "b": 2})
+    caches["shared"].set("c", 3)
+    tiered.local.delete("b")
+
+    assert tiered.get_many(["a", "b", "c", "d"]) == {"a": 1, "b": 2, "c": 3}
+    assert tiered.local.get_many(["a", "b", "c"]) == {"a": 1, "b": 2, "c": 3}
+    assert tiered.get_many(["a"]) == {"a": 1}
+
+    tiered.delete_many(["a", "b"])
+    assert tiered.get_many(["a", "b", "c"]) == {"c": 3}
+
+
+def test_tiered_cache_incr(tiered):
+    tiered.set("counter", 1)
+
+    assert tiered.incr("counter") == 2
+    assert tiered.get("counter") == 2
+
+
+def test_tiered_cache_touch_has_key_and_delete(tiered):
+    tiered.set("key", "value")
+    assert tiered.touch("key", 60)
+    assert tiered.has_key("key")
+
+    tiered.local.clear()
+    assert tiered.has_key("key")
+
+    assert tiered.delete("key")
+    assert not tiered.has_key("key")
+    assert caches["shared"].get("key") is None
+
+
+def test_tiered_cache_clear(tiered):
+    tiered.set("key", "value")
+
+    tiered.clear()
+
+    assert tiered.local.get("key") is None
+    assert caches["shared"].get("key") is None
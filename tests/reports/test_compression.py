@@ -0,0 +1,79 @@
+import gzip
+import os
+import zlib
+
+import pytest
+from django.test import RequestFactory
+
+from reports.compression import (
+    accepts_gzip,
+    compress_fragment,
+    crc32_combine,
+    gzip_around,
+    iter_gzip_around,
+)
+
+
+@pytest.mark.parametrize("first,second", [(0, 0), (10, 0), (0, 10), (1000, 70_000)])
+def test_crc32_combine(first, second):
+    data1, data2 = os.urandom(first), os.urandom(second)
+
+    assert crc32_combine(zlib.crc32(data1), zlib.crc32(data2), len(data2)) == (
+        zlib.crc32(data1 + data2)
+    )
+
+
+def test_gzip_around():
+    prefix = b"<html><body>"
+    body = b"<p>report</p>" * 1000
+    suffix = b"</body></html>"
+
+    fragment = compress_fragment(body)
+
+    assert len(fragment[0]) < len(body)
+    assert gzip.decompress(gzip_around(prefix, fragment, suffix)) == (
+        prefix + body + suffix
+    )
+
+
+def test_iter_gzip_around():
+    prefix = b"<html><body>"
+    body = os.urandom(10_000)
+    suffix = b"</body></html>"
+
+    fragment = compress_fragment(body)
+    parts = list(iter_gzip_around(prefix, fragment, suffix, chunk_size=1000))
+
+    # the prefix, the fragment in chunks, and the suffix
+    assert len(parts) == 2 + -(-len(fragment[0]) // 1000)
+    assert parts[1:-1] == [
+        fragment[0][start : start + 1000] for start in range(0, len(fragment[0]), 1000)
+    ]
+    assert gzip.decompress(b"".join(parts)) == prefix + body + suffix
+
+
+def test_iter_gzip_around_gets_fragment_after_prefix():
+    prefix = b"<html><body>"
+    suffix = b"</body></html>"
+    fragment = compress_fragment(b"<p>foo</p>")
+    calls = []
+
+    def get_fragment():
+        calls.append(True)
+        return fragment
+
+    parts = iter_gzip_around(prefix, get_fragment, suffix)
+    first = next(parts)
+    assert not calls
+
+    assert gzip.decompress(first + b"".join(parts)) == prefix + b"<p>foo</p>" + suffix
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [("gzip, deflate, br", True), ("br", False), ("", False)],
+)
+def test_accepts_gzip(header, expected):
+    request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=header)
+    assert accepts_gzip(request) is expected
@@ -1,11 +1,11 @@
 import json
 from base64 import b64encode
-from datetime import date
+from datetime import UTC, date, datetime
 
 import pytest
 from osgithub import GithubAPIException, GithubClient, GithubRepo
 
-from reports.github import GithubReport
+from reports.github import CHECK_TIMEOUT, GithubReport
 
 from ..factories import ReportFactory
 
@@ -244,3 +244,38 @@ def test_integration(bennett_org):
 </html>
 """
     )
+
+
+@pytest.mark.django_db
+def test_github_report_check(bennett_org, httpretty, mocker):
+    url = "https://api.github.com/repos/opensafely/test/commits?sha=main&path=foo.html&per_page=1"
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(
+                status=200,
+                body=json.dumps(
+                    [{"commit": {"committer": {"date": "2021-04-25T10:00:00Z"}}}]
+                ),
+                adding_headers={"ETag": '"abc"'},
+            ),
+            httpretty.Response(status=304, body=""),
+        ],
+    )
+    report = ReportFactory(
+        org=bennett_org, repo="test", branch="main", report_html_file_path="foo.html"
+    )
+    github_report = GithubReport(report, use_cache=False)
+    get = mocker.spy(github_report.client.session, "get")
+
+    assert github_report.check("", "") == (
+        '"abc"',
+        "",
+        datetime(2021, 4, 25, 10, tzinfo=UTC),
+    )
+    assert "If-None-Match" not in httpretty.last_request().headers
+
+    assert github_report.check('"abc"', "") is None
+    assert httpretty.last_request().headers["If-None-Match"] == '"abc"'
+    assert get.call_args.kwargs["timeout"] == CHECK_TIMEOUT
@@ -0,0 +1,46 @@
+import base64
+import hashlib
+
+import pytest
+
+from reports.images import extract_image, image_path
+
+
+PNG = b"\x89PNG\r\n\x1a\nnot really a png"
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def data_uri(content, content_type="image/png"):
+    return f"data:{content_type};base64,{base64.b64encode(content).decode()}"
+
+
+def test_extract_image(media_root):
+    name = f"{hashlib.sha256(PNG).hexdigest()}.png"
+
+    assert extract_image(data_uri(PNG)) == f"/report-images/{name}"
+    assert (media_root / image_path(name)).read_bytes() == PNG
+
+    # the same image is stored once
+    assert extract_image(data_uri(PNG)) == f"/report-images/{name}"
+    assert len(list((media_root / "report-images").iterdir())) == 1
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "https://example.com/plot.png",
+        "image/png;base64,iVBORw0KGgo=",
+        data_uri(b"<svg><script>alert(1)</script></svg>", "image/svg+xml"),
+        "data:image/png,not-base64",
+        "data:image/png;base64,not valid base64!",
+    ],
+    ids=["url", "not a data uri", "svg", "not base64", "invalid base64"],
+)
+def test_extract_image_leaves_other_images(media_root, src):
+    assert extract_image(src) is None
+    assert not (media_root / "report-images").exists()
@@ -1,10 +1,15 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 import pytest
 from django.utils import timezone
 from django.utils.http import http_date
 
-from reports.job_server import JobServerClient, JobServerReport
+from reports.job_server import (
+    FileTooLarge,
+    JobServerClient,
+    JobServerReport,
+    get_session,
+)
 
 from ..factories import ReportFactory
 
@@ -66,7 +71,10 @@ def test_clear_cache_with_caching_session(httpretty, bennett_org):
 
     wrapper = JobServerReport(report, use_cache=True)
 
+    # the file itself isn't cached, but checking that it exists is
     wrapper.get_html()
+    assert not wrapper.client.session.cache.contains(url=url)
+    wrapper.file_exists()
     assert url in wrapper.client.session.cache.urls()
 
     wrapper.clear_cache()
@@ -110,11 +118,12 @@ def test_get_html_caches(httpretty, bennett_org):
 
     job_server_report = JobServerReport(report)
 
+    # fetching the file and updating the report's last_updated makes just one request
     job_server_report.get_html()
-    assert len(httpretty.latest_requests()) == 3
+    assert len(httpretty.latest_requests()) == 2
 
     job_server_report.get_html()
-    assert len(httpretty.latest_requests()) == 3
+    assert len(httpretty.latest_requests()) == 2
 
 
 @pytest.mark.django_db
@@ -206,9 +215,9 @@ def test_last_updated(httpretty, bennett_org):
         branch="",
         report_html_file_path="",
     )
-    job_server_report = JobServerReport(report)
+    JobServerReport(report).get_html()
 
-    assert job_server_report.last_updated() == report.last_updated
+    assert report.last_updated == timezone.now().date()
 
 
 @pytest.mark.django_db
@@ -257,3 +266,283 @@ def test_report_last_updated_after_fetching(httpretty, bennett_org):
     JobServerReport(report).get_html()
     report.refresh_from_db()
     assert report.last_updated == now.date()
+
+
+@pytest.mark.django_db
+def test_get_html_fetches_once_without_request_cache(httpretty, bennett_org):
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+
+    # Mock the job-server file_exists() request
+    httpretty.register_uri(
+        httpretty.HEAD, url, responses=[httpretty.Response(status=200, body="")]
+    )
+
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(
+                status=200,
+                body="<p>foo</p>",
+                adding_headers={"Last-Modified": http_date(timezone.now().timestamp())},
+            )
+        ],
+    )
+
+    report = ReportFactory(
+        org=bennett_org,
+        job_server_url=url,
+        repo="",
+        branch="",
+        report_html_file_path="",
+    )
+    job_server_report = JobServerReport(report, use_cache=False)
+    requests_before = len(httpretty.latest_requests())
+
+    assert job_server_report.get_html() == "<p>foo</p>"
+    assert report.last_updated == timezone.now().date()
+    assert job_server_report.get_html() == "<p>foo</p>"
+
+    # one GET for the file; saving the updated last_updated doesn't re-validate the
+    # report with a HEAD request
+    new_requests = httpretty.latest_requests()[requests_before:]
+    assert [request.method for request in new_requests] == ["GET"]
+
+
+def test_clients_share_sessions():
+    cached = JobServerClient(use_cache=True)
+    assert JobServerClient(use_cache=True).session is cached.session
+    assert JobServerClient(use_cache=True, token="test").session is cached.session
+    assert JobServerClient(use_cache=False).session is not cached.session
+    assert get_session(use_cache=True, urls_expire_after={"*/releases": 60}) is not (
+        cached.session
+    )
+
+    adapter = cached.session.get_adapter("https://jobs.opensafely.org")
+    assert adapter.max_retries.total == JobServerClient.max_retries
+    assert adapter._pool_maxsize == JobServerClient.pool_size
+
+
+def test_tokens_are_not_shared_between_clients(httpretty):
+    url = "https://jobs.opensafely.org/api/v2/releases/file/file_id"
+    httpretty.register_uri(
+        httpretty.HEAD, url, responses=[httpretty.Response(status=200, body="")]
+    )
+
+    JobServerClient(token="first").file_exists(url)
+    JobServerClient(token="second").file_exists(url)
+
+    assert [
+        request.headers["Authorization"] for request in httpretty.latest_requests()
+    ] == [
+        "first",
+        "second",
+    ]
+    assert httpretty.last_request().headers["User-Agent"] == JobServerClient.user_agent
+
+
+def test_get_file_retries_server_errors(httpretty, mocker):
+    mocker.patch("urllib3.util.retry.Retry.sleep")
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(status=503, body=""),
+            httpretty.Response(
+                status=200,
+                body="<p>foo</p>",
+                adding_headers={"Last-Modified": http_date(timezone.now().timestamp())},
+            ),
+        ],
+    )
+
+    html, _ = JobServerClient().get_file(url)
+
+    assert html == "<p>foo</p>"
+    assert len(httpretty.latest_requests()) == 2
+
+
+def test_get_file_streams_with_timeouts(httpretty, mocker):
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+    body = "<p>caf\u00e9</p>" * 10
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(
+                status=200,
+                body=body.encode(),
+                adding_headers={
+                    "Content-Type": "text/html; charset=utf-8",
+                    "Last-Modified": http_date(timezone.now().timestamp()),
+                },
+            )
+        ],
+    )
+    # split multi-byte characters across chunks
+    mocker.patch.object(JobServerClient, "chunk_size", 5)
+    client = JobServerClient()
+    get = mocker.spy(client.session, "get")
+
+    html, _ = client.get_file(url)
+
+    assert html == body
+    assert get.call_args.kwargs["stream"]
+    assert get.call_args.kwargs["timeout"] == (
+        JobServerClient.connect_timeout,
+        JobServerClient.read_timeout,
+    )
+
+
+def test_get_file_detects_missing_encoding(httpretty):
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(
+                status=200,
+                body="<p>caf\u00e9</p>".encode(),
+                forcing_headers={
+                    "Content-Type": "application/octet-stream",
+                    "Last-Modified": http_date(timezone.now().timestamp()),
+                },
+            )
+        ],
+    )
+
+    html, _ = JobServerClient().get_file(url)
+
+    assert html == "<p>caf\u00e9</p>"
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"Content-Length": "11"},
+        # without a Content-Length, the size is checked as the body is downloaded
+        {},
+    ],
+    ids=["content-length", "streamed"],
+)
+def test_get_file_too_large(httpretty, mocker, headers):
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(
+                status=200,
+                body="<p>foo</p>!",
+                forcing_headers={"Content-Type": "text/html", **headers},
+            )
+        ],
+    )
+    mocker.patch.object(JobServerClient, "max_file_size", 10)
+    mocker.patch.object(JobServerClient, "chunk_size", 4)
+
+    with pytest.raises(FileTooLarge, match="larger than the maximum of 10 bytes"):
+        JobServerClient().get_file(url)
+
+
+def test_get_file_too_large_with_request_cache(httpretty, mocker):
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+    httpretty.register_uri(
+        httpretty.GET,
+        url,
+        responses=[
+            httpretty.Response(
+                status=200,
+                body="<p>foo</p>" * 1024,
+                forcing_headers={"Content-Type": "text/html"},
+            )
+        ],
+    )
+    mocker.patch.object(JobServerClient, "max_file_size", 10)
+    mocker.patch.object(JobServerClient, "chunk_size", 4)
+    client = JobServerClient(use_cache=True)
+
+    # the size is checked before the rest of the body is downloaded
+    with pytest.raises(FileTooLarge, match=r"\(12 bytes\)"):
+        client.get_file(url)
+    # and the body isn't cached
+    assert not client.session.cache.contains(url=url)
+
+
+@pytest.mark.parametrize(
+    "etag,last_modified,responses,expected",
+    [
+        # never checked before
+        (
+            "",
+            "",
+            [
+                (
+                    200,
+                    {"ETag": '"abc"', "Last-Modified": "Sun, 25 Apr 2021 10:00:00 GMT"},
+                )
+            ],
+            ('"abc"', "Sun, 25 Apr 2021 10:00:00 GMT", datetime(2021, 4, 25, 10)),
+        ),
+        # unchanged
+        ('"abc"', "Sun, 25 Apr 2021 10:00:00 GMT", [(304, {})], None),
+        # unchanged, but the conditional request was ignored
+        (
+            '"abc"',
+            "Sun, 25 Apr 2021 10:00:00 GMT",
+            [
+                (
+                    200,
+                    {"ETag": '"abc"', "Last-Modified": "Sun, 25 Apr 2021 10:00:00 GMT"},
+                )
+            ],
+            None,
+        ),
+        # changed
+        (
+            '"abc"',
+            "Sun, 25 Apr 2021 10:00:00 GMT",
+            [
+                (
+                    200,
+                    {"ETag": '"def"', "Last-Modified": "Mon, 26 Apr 2021 10:00:00 GMT"},
+                )
+            ],
+            ('"def"', "Mon, 26 Apr 2021 10:00:00 GMT", datetime(2021, 4, 26, 10)),
+        ),
+    ],
+    ids=["first check", "unchanged", "unchanged without 304", "changed"],
+)
+@pytest.mark.django_db
+def test_job_server_report_check(
+    httpretty, bennett_org, etag, last_modified, responses, expected
+):
+    url = "https://jobs.opensafely.org/org/project/workspace/published/file_id/"
+    # Mock the job-server file_exists() request
+    httpretty.register_uri(
+        httpretty.HEAD, url, responses=[httpretty.Response(status=200, body="")]
+    )
+    report = ReportFactory(
+        org=bennett_org,
+        job_server_url=url,
+        repo="",
+        branch="",
+        report_html_file_path="",
+    )
+
+    httpretty.register_uri(
+        httpretty.HEAD,
+        url,
+        responses=[
+            httpretty.Response(status=status, body="", adding_headers=headers)
+            for status, headers in responses
+        ],
+    )
+
+    assert JobServerReport(report).check(etag, last_modified) == expected
+
+    request = httpretty.last_request()
+    assert request.method == "HEAD"
+    assert request.headers.get("If-None-Match") == (etag or None)
+    assert request.headers.get("If-Modified-Since") == (last_modified or None)
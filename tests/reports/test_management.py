@@ -1,11 +1,15 @@
+from datetime import date, datetime
+from io import StringIO
+
 import pytest
 from django.contrib.auth.models import Group, Permission
 from django.core import management
 
 from gateway.models import User
-from reports.models import Link, Report
+from reports.models import Link, RenderedReport, Report, ReportRender
+from reports.rendering import acquire_render_lock, render_report
 
-from ..factories import UserFactory
+from ..factories import ReportFactory, UserFactory
 
 
 @pytest.mark.django_db
@@ -93,3 +97,261 @@ def test_ensure_groups_existing_group():
     permissions = Permission.objects.filter(content_type__app_label="reports")
     for permission in permissions:
         assert permission in group.permissions.all()
+
+
+@pytest.mark.django_db
+def test_render_reports(mocker, bennett_org):
+    render = mocker.patch("reports.management.commands.render_reports.render_report")
+    prune = mocker.patch("reports.management.commands.render_reports.prune_renders")
+    mocker.patch(
+        "reports.management.commands.render_reports.get_render",
+        side_effect=lambda report: object() if report == rendered else None,
+    )
+    rendered = ReportFactory(org=bennett_org)
+    unrendered = ReportFactory(org=bennett_org)
+
+    management.call_command("render_reports")
+    render.assert_called_once_with(unrendered)
+    prune.assert_called_once()
+
+    # --force re-renders everything
+    render.reset_mock()
+    management.call_command("render_reports", force=True)
+    assert render.call_count == 2
+
+
+@pytest.mark.django_db
+def test_render_reports_skips_reports_being_rendered(mocker, bennett_org):
+    render = mocker.patch("reports.management.commands.render_reports.render_report")
+    rendering = ReportFactory(org=bennett_org)
+    unrendered = ReportFactory(org=bennett_org)
+    acquire_render_lock(rendering.pk, rendering.cache_token)
+
+    out = StringIO()
+    management.call_command("render_reports", stdout=out)
+
+    render.assert_called_once_with(unrendered)
+    assert f"Report '{rendering.slug}' is already being rendered" in out.getvalue()
+    # the lock is released after rendering
+    assert acquire_render_lock(unrendered.pk, unrendered.cache_token)
+
+
+@pytest.mark.django_db
+def test_render_reports_continues_after_failure(mocker, log_output, bennett_org):
+    broken = ReportFactory(org=bennett_org)
+    ReportFactory(org=bennett_org)
+
+    def render_report(report):
+        if report == broken:
+            raise Exception("boom")
+
+    render = mocker.patch(
+        "reports.management.commands.render_reports.render_report",
+        side_effect=render_report,
+    )
+
+    management.call_command("render_reports")
+
+    assert render.call_count == 2
+    failure_log = next(
+        log for log in log_output.entries if log["event"] == "Report render failed"
+    )
+    assert failure_log["report_id"] == broken.pk
+
+
+@pytest.mark.django_db
+def test_render_reports_watch(mocker, bennett_org):
+    ReportFactory(org=bennett_org)
+    render = mocker.patch("reports.management.commands.render_reports.render_report")
+    sleep = mocker.patch(
+        "reports.management.commands.render_reports.time.sleep",
+        side_effect=[None, KeyboardInterrupt],
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        management.call_command("render_reports", watch=True, interval=5)
+
+    sleep.assert_called_with(5)
+    # rendered once on startup, and once after the first interval
+    assert render.call_count == 2
+
+
+@pytest.mark.django_db
+def test_poll_reports(mocker, bennett_org, mock_repo_url):
+    mock_repo_url("https://github.com/opensafely/test")
+    unchanged = ReportFactory(org=bennett_org, source_etag="current")
+    changed = ReportFactory(org=bennett_org, source_etag="old")
+    broken = ReportFactory(org=bennett_org, source_etag="broken")
+
+    def check(self, etag, last_modified):
+        if etag == "broken":
+            raise Exception("boom")
+        if etag == "current":
+            return None
+        return "current", "", datetime(2021, 4, 25, 10)
+
+    mocker.patch("reports.github.GithubReport.check", check)
+    rendered_tokens = {}
+    render = mocker.patch(
+        "reports.management.commands.poll_reports.render_report",
+        side_effect=lambda report: rendered_tokens.update(
+            {report.pk: report.cache_token}
+        ),
+    )
+    initial_tokens = {
+        report.pk: report.cache_token for report in [unchanged, changed, broken]
+    }
+
+    management.call_command("poll_reports", workers=2)
+
+    # only the changed report is re-rendered, with its new cache token
+    render.assert_called_once()
+    for report in [unchanged, changed, broken]:
+        report.refresh_from_db()
+    assert unchanged.cache_token == initial_tokens[unchanged.pk]
+    assert broken.cache_token == initial_tokens[broken.pk]
+    assert changed.cache_token != initial_tokens[changed.pk]
+    assert rendered_tokens == {changed.pk: changed.cache_token}
+    assert changed.source_etag == "current"
+    assert changed.last_updated == date(2021, 4, 25)
+
+
+@pytest.mark.django_db
+def test_poll_reports_prunes_old_renders(mocker, freezer, bennett_org, mock_repo_url):
+    mock_repo_url("https://github.com/opensafely/test")
+    # the file is only fetched to render it
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<p>old</p>"
+    mocker.patch("reports.rendering.get_remote", return_value=remote)
+    report = ReportFactory(org=bennett_org, source_etag="old")
+    freezer.move_to("2021-04-25 10:00")
+    render_report(report)
+    freezer.move_to("2021-04-26 10:00")
+    mocker.patch(
+        "reports.github.GithubReport.check",
+        return_value=("current", "", datetime(2021, 4, 25, 10)),
+    )
+    remote.get_html.return_value = "<p>new</p>"
+
+    management.call_command("poll_reports")
+
+    report.refresh_from_db()
+    assert list(ReportRender.objects.values_list("cache_token", flat=True)) == [
+        report.cache_token
+    ]
+    assert RenderedReport.objects.get().html == "<p>new</p>"
+
+
+@pytest.mark.django_db
+def test_poll_reports_first_check(mocker, bennett_org, mock_repo_url):
+    mock_repo_url("https://github.com/opensafely/test")
+    # neither report has been checked before
+    rendered = ReportFactory(org=bennett_org, last_updated=date(2021, 4, 25))
+    unrendered = ReportFactory(org=bennett_org, last_updated=date(2021, 4, 25))
+    initial_token = rendered.cache_token
+    mocker.patch(
+        "reports.github.GithubReport.check",
+        return_value=("current", "", datetime(2021, 4, 25, 10)),
+    )
+    mocker.patch(
+        "reports.management.commands.poll_reports.get_render",
+        side_effect=lambda report: None if report.pk == unrendered.pk else object(),
+    )
+    render = mocker.patch("reports.management.commands.poll_reports.render_report")
+
+    management.call_command("poll_reports")
+
+    # the unchanged report only has its validators recorded
+    rendered.refresh_from_db()
+    assert rendered.cache_token == initial_token
+    assert rendered.source_etag == "current"
+    # but the report that has never been rendered is rendered
+    render.assert_called_once()
+    assert render.call_args.args[0].pk == unrendered.pk
+
+
+@pytest.mark.django_db
+def test_poll_reports_saves_token_after_render_failure(
+    mocker, log_output, bennett_org, mock_repo_url
+):
+    mock_repo_url("https://github.com/opensafely/test")
+    report = ReportFactory(org=bennett_org)
+    initial_token = report.cache_token
+    mocker.patch(
+        "reports.github.GithubReport.check",
+        return_value=("current", "", datetime(2021, 4, 25, 10)),
+    )
+    mocker.patch(
+        "reports.management.commands.poll_reports.render_report",
+        side_effect=Exception("boom"),
+    )
+
+    management.call_command("poll_reports")
+
+    report.refresh_from_db()
+    assert report.cache_token != initial_token
+    assert any(log["event"] == "Report render failed" for log in log_output.entries)
+
+
+@pytest.mark.django_db
+def test_poll_reports_watch(mocker, bennett_org):
+    ReportFactory(org=bennett_org, source_etag="current")
+    check = mocker.patch("reports.github.GithubReport.check", return_value=None)
+    sleep = mocker.patch(
+        "reports.management.commands.poll_reports.time.sleep",
+        side_effect=[None, KeyboardInterrupt],
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        management.call_command("poll_reports", watch=True, interval=60)
+
+    sleep.assert_called_with(60)
+    assert check.call_count == 2
+
+
+@pytest.mark.django_db
+def test_poll_reports_watch_continues_after_failure(mocker, log_output):
+    poll = mocker.patch(
+        "reports.management.commands.poll_reports.Command.poll_reports",
+        side_effect=[Exception("boom"), None],
+    )
+    mocker.patch(
+        "reports.management.commands.poll_reports.time.sleep",
+        side_effect=[None, KeyboardInterrupt],
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        management.call_command("poll_reports", watch=True)
+
+    assert poll.call_count == 2
+    assert any(log["event"] == "Polling reports failed" for log in log_output.entries)
+
+
+@pytest.mark.django_db
+def test_poll_reports_continues_after_refresh_failure(
+    mocker, log_output, bennett_org, mock_repo_url
+):
+    mock_repo_url("https://github.com/opensafely/test")
+    broken = ReportFactory(org=bennett_org, source_etag="old")
+    other = ReportFactory(org=bennett_org, source_etag="old")
+    mocker.patch(
+        "reports.github.GithubReport.check",
+        return_value=("current", "", datetime(2021, 4, 25, 10)),
+    )
+    render = mocker.patch("reports.management.commands.poll_reports.render_report")
+    refresh_cache_token = Report.refresh_cache_token
+
+    def refresh(report, **kwargs):
+        if report == broken:
+            raise ConnectionError("boom")
+        refresh_cache_token(report, **kwargs)
+
+    mocker.patch.object(Report, "refresh_cache_token", refresh)
+
+    management.call_command("poll_reports", workers=1)
+
+    render.assert_called_once_with(other)
+    assert any(
+        log["event"] == "Report source check failed" and log["report_id"] == broken.pk
+        for log in log_output.entries
+    )
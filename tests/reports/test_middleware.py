@@ -0,0 +1,128 @@
+import gzip
+
+import pytest
+from django.conf import settings as django_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from reports.models import Report
+
+from ..factories import ReportFactory
+
+
+@pytest.fixture
+def page_cache(settings):
+    settings.PAGE_CACHE_SECONDS = 60
+
+
+def report_queries(queries):
+    return [query for query in queries if "reports_report" in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_xss_filtering_middleware(client):
+    response = client.get("/")
+    assert response["X-XSS-Protection"] == "1; mode=block"
+
+
+@pytest.mark.django_db
+def test_page_cache_serves_anonymous_users(client, page_cache, rendered_report):
+    url = rendered_report.get_absolute_url()
+    response = client.get(url)
+    assert response.templates
+
+    with CaptureQueriesContext(connection) as queries:
+        cached = client.get(url)
+
+    assert not cached.templates
+    assert report_queries(queries) == []
+    assert cached.content == response.content
+    assert cached["ETag"] == response["ETag"]
+
+    # a conditional request is answered from the cache too
+    not_modified = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert not_modified.status_code == 304
+    assert not not_modified.templates
+
+
+@pytest.mark.django_db
+def test_page_cache_stores_gzipped_pages(client, page_cache, rendered_report):
+    url = rendered_report.get_absolute_url()
+    response = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+
+    cached = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+    assert not cached.templates
+    assert gzip.decompress(cached.content) == gzip.decompress(response.content)
+
+    # pages vary by Accept-Encoding
+    uncompressed = client.get(url)
+    assert uncompressed.templates
+    assert "Content-Encoding" not in uncompressed
+
+
+@pytest.mark.django_db
+def test_page_cache_is_dropped_on_release(
+    client, page_cache, settings, rendered_report
+):
+    url = rendered_report.get_absolute_url()
+    client.get(url)
+    assert not client.get(url).templates
+
+    # cached pages link to the previous release's assets
+    settings.RELEASE = "new-release"
+    assert client.get(url).templates
+
+
+@pytest.mark.django_db
+def test_page_cache_is_dropped_on_changes(
+    client, page_cache, rendered_report, django_capture_on_commit_callbacks
+):
+    url = rendered_report.get_absolute_url()
+    client.get(url)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        report = Report.objects.get(pk=rendered_report.pk)
+        report.title = "A new title"
+        report.save()
+
+    response = client.get(url)
+    assert response.templates
+    assert "A new title" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_page_cache_skips_users_with_sessions(client, page_cache, rendered_report):
+    url = rendered_report.get_absolute_url()
+    client.get(url)
+
+    client.cookies[django_settings.SESSION_COOKIE_NAME] = "session"
+    assert client.get(url).templates
+
+
+@pytest.mark.django_db
+def test_page_cache_skips_pages_that_cannot_be_shared(
+    client, page_cache, mocker, bennett_org, rendered_report
+):
+    mocker.patch("reports.views.schedule_render")
+    unrendered = ReportFactory(org=bennett_org, is_draft=False)
+
+    # the placeholder page can't be cached
+    client.get(unrendered.get_absolute_url())
+    assert client.get(unrendered.get_absolute_url()).templates
+
+    # nor can errors
+    client.get("/does-not-exist/")
+    assert client.get("/does-not-exist/").templates
+
+    # and only GETs are served from the cache
+    client.get(rendered_report.get_absolute_url())
+    assert client.head(rendered_report.get_absolute_url()).templates
+
+
+@pytest.mark.django_db
+def test_page_cache_off(client, settings, rendered_report):
+    settings.PAGE_CACHE_SECONDS = 0
+    url = rendered_report.get_absolute_url()
+    client.get(url)
+
+    assert client.get(url).templates
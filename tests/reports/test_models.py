@@ -1,10 +1,14 @@
+from datetime import date
 from os import environ
 
 import pytest
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import ValidationError
+from django.db import connection
 
-from reports.models import Category, Link, Report
+from reports.activity import recent_activity
+from reports.models import Category, Link, RenderedReport, Report
+from reports.navigation import nav_tree_reports
 
 from ..factories import CategoryFactory, LinkFactory, ReportFactory, UserFactory
 
@@ -314,24 +318,20 @@ def test_report_with_unpublished_job_server_url_does_not_add_trailing_slash(
 
 
 @pytest.mark.parametrize(
-    "update_fields,cache_token_changed",
+    "update_fields,cache_token_changed,front_matter_token_changed",
     [
-        ({}, False),
-        (
-            {"description": "new"},
-            True,
-        ),
-        ({"is_draft": False}, False),
-        (
-            {"report_html_file_path": "foo.html"},
-            True,
-        ),
+        ({}, False, False),
+        ({"description": "new"}, False, True),
+        ({"is_draft": False}, False, False),
+        ({"report_html_file_path": "foo.html"}, True, False),
+        ({"report_html_file_path": "foo.html", "title": "new"}, True, True),
     ],
     ids=[
         "no updates",
-        "non-repo field updated",
+        "front matter field updated",
         "irrelevant field updated",
         "repo field updated",
+        "repo and front matter fields updated",
     ],
 )
 @pytest.mark.django_db
@@ -340,6 +340,7 @@ def test_cache_refresh_on_report_save(
     mock_repo_url,
     update_fields,
     cache_token_changed,
+    front_matter_token_changed,
 ):
     mock_repo_url("https://github.com/opensafely/test")
     report = ReportFactory(
@@ -352,6 +353,7 @@ def test_cache_refresh_on_report_save(
     )
     report_id = report.id
     initial_cache_token = report.cache_token
+    initial_front_matter_token = report.front_matter_token
 
     # Fetch from the db again so the initial values are registered
     report = Report.objects.get(id=report_id)
@@ -360,6 +362,33 @@ def test_cache_refresh_on_report_save(
         setattr(report, field, value)
     report.save()
     assert (initial_cache_token != report.cache_token) == cache_token_changed
+    assert (
+        initial_front_matter_token != report.front_matter_token
+    ) == front_matter_token_changed
+
+
+@pytest.mark.django_db
+def test_cache_refresh_on_report_save_with_job_server_url(bennett_org, httpretty):
+    url = "http://example.com/published/foo/"
+    new_url = "http://example.com/published/bar/"
+    for file_url in [url, new_url]:
+        httpretty.register_uri(httpretty.HEAD, file_url, status=200)
+    report = ReportFactory(
+        org=bennett_org,
+        repo="",
+        branch="",
+        report_html_file_path="",
+        job_server_url=url,
+    )
+    initial_cache_token = report.cache_token
+    initial_front_matter_token = report.front_matter_token
+
+    report = Report.objects.get(id=report.id)
+    report.job_server_url = new_url
+    report.save()
+
+    assert report.cache_token != initial_cache_token
+    assert report.front_matter_token == initial_front_matter_token
 
 
 @pytest.mark.django_db
@@ -373,23 +402,27 @@ def test_cache_refresh_on_report_save_with_links(bennett_org):
         is_draft=False,
     )
     initial_cache_token = report.cache_token
+    initial_front_matter_token = report.front_matter_token
     # add a new link
     link = LinkFactory(report=report, url="https://test.test", label="test")
     report.refresh_from_db()
-    assert initial_cache_token != report.cache_token
+    assert initial_front_matter_token != report.front_matter_token
 
     # # update link
-    initial_cache_token = report.cache_token
+    initial_front_matter_token = report.front_matter_token
     link.icon = "github"
     link.save()
     report.refresh_from_db()
-    assert initial_cache_token != report.cache_token
+    assert initial_front_matter_token != report.front_matter_token
 
     # delete link
-    initial_cache_token = report.cache_token
+    initial_front_matter_token = report.front_matter_token
     link.delete()
     report.refresh_from_db()
-    assert initial_cache_token != report.cache_token
+    assert initial_front_matter_token != report.front_matter_token
+
+    # links are front matter; the report's file doesn't need fetching again
+    assert report.cache_token == initial_cache_token
 
 
 @pytest.mark.django_db
@@ -417,7 +450,7 @@ def test_report_save_with_multiple_links_not_including_source(
     # and does NOT have a source-repo link
     mock_repo_url("https://github.com/opensafely/test")
     report = ReportFactory(org=bennett_org, repo="test", branch="main")
-    initial_cache_token = report.cache_token
+    initial_front_matter_token = report.front_matter_token
 
     # This report has one link, for the source
     assert Link.objects.count() == 1
@@ -427,26 +460,31 @@ def test_report_save_with_multiple_links_not_including_source(
     # Create a second link
     Link.objects.create(report=report, url="http://test", label="test")
     report.refresh_from_db()
-    cache_token_after_link_2_creation = report.cache_token
-    assert cache_token_after_link_2_creation != initial_cache_token
+    front_matter_token_after_link_2_creation = report.front_matter_token
+    assert front_matter_token_after_link_2_creation != initial_front_matter_token
 
     # Delete the source link
     assert Link.objects.count() == 2
     Link.objects.get(url="https://github.com/opensafely/test").delete()
     report.refresh_from_db()
-    cache_token_after_source_link_deletion = report.cache_token
-    assert cache_token_after_source_link_deletion != cache_token_after_link_2_creation
+    front_matter_token_after_source_link_deletion = report.front_matter_token
+    assert (
+        front_matter_token_after_source_link_deletion
+        != front_matter_token_after_link_2_creation
+    )
 
     # Save the report again; previously this resulted in a max recursion error as the
-    # report attempts to create the source link again and refresh the cache token
+    # report attempts to create the source link again and refresh the front matter token
     report.save()
     # The source link is re-created on save
     assert Link.objects.count() == 2
     assert Link.objects.filter(url="https://github.com/opensafely/test").exists()
 
     report.refresh_from_db()
-    cache_token_after_save = report.cache_token
-    assert cache_token_after_save != cache_token_after_source_link_deletion
+    front_matter_token_after_save = report.front_matter_token
+    assert (
+        front_matter_token_after_save != front_matter_token_after_source_link_deletion
+    )
 
 
 @pytest.mark.django_db
@@ -496,6 +534,44 @@ def test_category_str():
     assert str(CategoryFactory(name="test")) == "test"
 
 
+@pytest.mark.django_db
+def test_rendered_report_str():
+    assert str(RenderedReport(content_hash="abcd")) == "abcd"
+
+
+def test_rendered_report_compressed_fragment():
+    # renders made before the compressed html was added
+    rendered = RenderedReport(html="<p>foo</p>")
+    assert not rendered.has_compressed_fragment
+    assert rendered.compressed_fragment is None
+
+    rendered = RenderedReport(html_deflate=b"abc", html_crc32=1, html_length=10)
+    assert rendered.has_compressed_fragment
+    assert rendered.compressed_fragment == (b"abc", 1, 10)
+
+
+@pytest.mark.django_db
+def test_report_save_remote_fields_skips_validation(bennett_org, mocker):
+    report = ReportFactory(org=bennett_org)
+    report = Report.objects.get(id=report.id)
+    initial_cache_token = report.cache_token
+    full_clean = mocker.spy(report, "full_clean")
+
+    report.last_updated = date(2021, 4, 25)
+    report.use_git_blob = True
+    report.save(update_fields=["last_updated", "use_git_blob"])
+
+    full_clean.assert_not_called()
+    report.refresh_from_db()
+    assert report.last_updated == date(2021, 4, 25)
+    assert report.use_git_blob
+    assert report.cache_token == initial_cache_token
+
+    # saving any other field is validated as normal
+    report.save(update_fields=["last_updated", "title"])
+    full_clean.assert_called_once()
+
+
 @pytest.mark.django_db
 def test_link_str(bennett_org):
     report = ReportFactory(repo="test", external_description="test")
@@ -536,3 +612,48 @@ def test_category_populated(bennett_org):
     print(Category.objects.all())
 
     assert list(Category.populated.for_user(user)) == list(Category.objects.all())
+
+
+def query_plan(queryset):
+    if connection.vendor == "postgresql":  # pragma: no cover
+        # tables this small are always scanned unless that is ruled out
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "queryset,index",
+    [
+        (lambda: nav_tree_reports("public"), "report_published_category"),
+        (lambda: recent_activity(AnonymousUser()), "report_activity_recent"),
+        (
+            lambda: recent_activity(UserFactory(is_superuser=True)),
+            "report_activity_recent",
+        ),
+        (
+            lambda: Report.objects.filter(job_server_url=""),
+            "report_job_server_url",
+        ),
+        pytest.param(
+            lambda: Category.objects.filter(name__iexact="archive"),
+            "category_name_upper",
+            marks=pytest.mark.skipif(
+                connection.vendor != "postgresql",
+                reason="name__iexact is a LIKE on SQLite, which can't use the index",
+            ),
+        ),
+    ],
+    ids=[
+        "navigation",
+        "recent activity",
+        "recent activity with drafts",
+        "hosting",
+        "archive",
+    ],
+)
+def test_queries_use_indexes(bennett_org, queryset, index):
+    ReportFactory(org=bennett_org)
+
+    assert index in query_plan(queryset())
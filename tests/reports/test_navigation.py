@@ -0,0 +1,210 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+
+from reports import navigation
+from reports.models import Category
+from reports.navigation import (
+    VISIBILITY_CLASSES,
+    build_nav_tree,
+    nav_tree_cache_key,
+    nav_tree_for_user,
+    nav_tree_version,
+    visibility_class,
+)
+
+from ..factories import CategoryFactory, ReportFactory, UserFactory
+
+
+def tree_names(tree):
+    return [
+        (category.name, [report.menu_name for report in category.reports])
+        for category in tree
+    ]
+
+
+@pytest.mark.django_db
+def test_visibility_class(user_with_permission):
+    assert visibility_class(AnonymousUser()) == "public"
+    assert visibility_class(UserFactory()) == "public"
+    assert visibility_class(user_with_permission) == "drafts"
+    assert visibility_class(UserFactory(is_staff=True)) == "staff"
+    assert visibility_class(UserFactory(is_staff=True, is_superuser=True)) == (
+        "staff-drafts"
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "visibility,expected",
+    [
+        ("public", [("Reports", ["b-published"]), ("Test", ["a-published"])]),
+        (
+            "drafts",
+            [
+                ("Drafts", ["draft"]),
+                ("Reports", ["b-published"]),
+                ("Test", ["a-published"]),
+            ],
+        ),
+        (
+            "staff",
+            [
+                ("Archive", ["archived"]),
+                ("Reports", ["b-published"]),
+                ("Test", ["a-published"]),
+            ],
+        ),
+        (
+            "staff-drafts",
+            [
+                ("Archive", ["archived"]),
+                ("Drafts", ["draft"]),
+                ("Reports", ["b-published"]),
+                ("Test", ["a-published"]),
+            ],
+        ),
+    ],
+)
+def test_build_nav_tree(bennett_org, visibility, expected):
+    test_category = CategoryFactory(name="Test")
+    ReportFactory(org=bennett_org, category=test_category, menu_name="a-published")
+    ReportFactory(
+        org=bennett_org,
+        category=Category.objects.get(name="Reports"),
+        menu_name="b-published",
+    )
+    ReportFactory(
+        org=bennett_org,
+        category=CategoryFactory(name="Drafts"),
+        menu_name="draft",
+        is_draft=True,
+    )
+    ReportFactory(
+        org=bennett_org, category=CategoryFactory(name="Archive"), menu_name="archived"
+    )
+
+    assert tree_names(build_nav_tree(visibility)) == expected
+
+
+@pytest.mark.django_db
+def test_build_nav_tree_reports(bennett_org, django_assert_num_queries):
+    category = CategoryFactory()
+    report = ReportFactory(
+        org=bennett_org, category=category, menu_name="draft", is_draft=True
+    )
+
+    with django_assert_num_queries(1):
+        (nav_category,) = build_nav_tree("drafts")
+
+    assert nav_category.id == category.id
+    (nav_report,) = nav_category.reports
+    assert nav_report.id == report.id
+    assert nav_report.is_draft
+    assert nav_report.get_absolute_url() == report.get_absolute_url()
+
+
+@pytest.mark.django_db
+def test_nav_tree_for_user_is_cached(bennett_org, mocker):
+    ReportFactory(
+        org=bennett_org,
+        category=Category.objects.get(name="Reports"),
+        menu_name="report",
+    )
+    build = mocker.spy(navigation, "build_nav_tree")
+
+    for user in [AnonymousUser(), UserFactory()]:
+        assert tree_names(nav_tree_for_user(user)) == [("Reports", ["report"])]
+
+    # both users are in the same visibility class, so share a tree
+    build.assert_called_once_with("public")
+
+
+@pytest.mark.django_db
+def test_nav_tree_cache_is_cleared_on_changes(
+    bennett_org, django_capture_on_commit_callbacks
+):
+    def cached_visibility_classes():
+        return set(
+            cache.get_many(
+                [nav_tree_cache_key(visibility) for visibility in VISIBILITY_CLASSES]
+            )
+        )
+
+    def populate_caches():
+        for visibility in VISIBILITY_CLASSES:
+            cache.set(nav_tree_cache_key(visibility), [])
+
+    report = ReportFactory(org=bennett_org)
+
+    populate_caches()
+    with django_capture_on_commit_callbacks(execute=True):
+        report.menu_name = "new name"
+        report.save()
+    assert cached_visibility_classes() == set()
+
+    populate_caches()
+    with django_capture_on_commit_callbacks(execute=True):
+        CategoryFactory()
+    assert cached_visibility_classes() == set()
+
+    populate_caches()
+    with django_capture_on_commit_callbacks(execute=True):
+        report.delete()
+    assert cached_visibility_classes() == set()
+
+    # saves of fields that aren't displayed in the tree leave it cached
+    report = ReportFactory(org=bennett_org)
+    populate_caches()
+    with django_capture_on_commit_callbacks(execute=True):
+        report.save(update_fields=["last_updated"])
+    assert len(cached_visibility_classes()) == len(VISIBILITY_CLASSES)
+
+
+@pytest.mark.django_db
+def test_nav_tree_cache_is_cleared_after_commit(
+    bennett_org, django_capture_on_commit_callbacks
+):
+    user = AnonymousUser()
+    nav_tree_for_user(user)
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        ReportFactory(org=bennett_org, is_draft=False)
+        # other requests can't see the new report yet, and a tree they build without it
+        # is replaced once it is committed
+        assert cache.get(nav_tree_cache_key(visibility_class(user))) is not None
+
+    for callback in callbacks:
+        callback()
+    assert cache.get(nav_tree_cache_key(visibility_class(user))) is None
+
+
+@pytest.mark.django_db
+def test_nav_tree_built_before_commit_is_not_served(
+    bennett_org, django_capture_on_commit_callbacks
+):
+    user = AnonymousUser()
+    # another request reads the tree's rows before the change is committed
+    key = nav_tree_cache_key(visibility_class(user))
+    stale_tree = build_nav_tree(visibility_class(user))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        report = ReportFactory(org=bennett_org, is_draft=False)
+    # and caches the tree afterwards
+    cache.set(key, stale_tree, timeout=None)
+
+    assert tree_names(nav_tree_for_user(user)) == [
+        (report.category.name, [report.menu_name])
+    ]
+
+
+@pytest.mark.django_db
+def test_nav_tree_version_changes_on_changes(
+    bennett_org, django_capture_on_commit_callbacks
+):
+    version = nav_tree_version()
+    assert nav_tree_version() == version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ReportFactory(org=bennett_org)
+    assert nav_tree_version() != version
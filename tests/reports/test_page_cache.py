@@ -0,0 +1,34 @@
+import pytest
+
+from reports.page_cache import page_cache_generation
+
+from ..factories import CategoryFactory, OrgFactory, ReportFactory
+
+
+@pytest.mark.django_db
+def test_page_cache_generation_changes_on_commit(
+    bennett_org, django_capture_on_commit_callbacks
+):
+    generation = page_cache_generation()
+    assert page_cache_generation() == generation
+
+    # the generation only changes once the change is committed
+    with django_capture_on_commit_callbacks() as callbacks:
+        ReportFactory(org=bennett_org)
+    assert page_cache_generation() == generation
+    for callback in callbacks:
+        callback()
+    assert page_cache_generation() != generation
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("factory", [CategoryFactory, OrgFactory])
+def test_page_cache_generation_changes_on_other_changes(
+    bennett_org, django_capture_on_commit_callbacks, factory
+):
+    generation = page_cache_generation()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        factory()
+
+    assert page_cache_generation() != generation
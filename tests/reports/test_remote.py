@@ -0,0 +1,69 @@
+from datetime import date, datetime
+
+import pytest
+
+from reports.remote import RemoteReport
+
+from ..factories import ReportFactory
+
+
+class FakeRemoteReport(RemoteReport):
+    fetch_count = 0
+
+    def fetch(self):
+        self.fetch_count += 1
+        return "<p>foo</p>", datetime(2021, 4, 25, 10)
+
+    def check(self, etag, last_modified):
+        if etag == "current":
+            return None
+        return "current", "Sun, 25 Apr 2021 10:00:00 GMT", datetime(2021, 4, 25, 10)
+
+
+@pytest.mark.django_db
+def test_remote_report_fetches_once(bennett_org):
+    report = ReportFactory(org=bennett_org)
+    remote = FakeRemoteReport(report)
+
+    assert remote.get_html() == "<p>foo</p>"
+    assert remote.get_html() == "<p>foo</p>"
+    assert remote.fetch_count == 1
+
+    report.refresh_from_db()
+    assert report.last_updated == date(2021, 4, 25)
+
+
+@pytest.mark.django_db
+def test_remote_report_record_check(bennett_org, mocker):
+    report = ReportFactory(org=bennett_org)
+    save = mocker.spy(report, "save")
+    remote = FakeRemoteReport(report)
+
+    assert remote.record_check(remote.check("", ""))
+    save.assert_called_once_with(
+        update_fields=["last_updated", "source_etag", "source_last_modified"]
+    )
+
+    report.refresh_from_db()
+    assert report.last_updated == date(2021, 4, 25)
+    assert report.source_etag == "current"
+    assert report.source_last_modified == "Sun, 25 Apr 2021 10:00:00 GMT"
+
+    # unchanged since the last check
+    save.reset_mock()
+    assert not remote.record_check(remote.check("current", ""))
+    save.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_remote_report_first_check(bennett_org):
+    # the date is unchanged, so only the validators are recorded
+    report = ReportFactory(org=bennett_org, last_updated=date(2021, 4, 25))
+    remote = FakeRemoteReport(report)
+    assert not remote.record_check(remote.check("", ""))
+    assert report.source_etag == "current"
+
+    report = ReportFactory(org=bennett_org, last_updated=date(2021, 4, 1))
+    remote = FakeRemoteReport(report)
+    assert remote.record_check(remote.check("", ""))
+    assert report.last_updated == date(2021, 4, 25)
@@ -1,7 +1,26 @@
+import base64
+import hashlib
+
 import pytest
+from django.core.cache import cache
 
-from reports.rendering import process_html
+from reports.models import RenderedReport, ReportRender
+from reports.rendering import (
+    RENDERER_VERSION,
+    _render_in_background,
+    _renders_in_flight,
+    acquire_render_lock,
+    content_hash,
+    get_render,
+    get_stale_render,
+    process_html,
+    prune_renders,
+    render_failed_key,
+    render_report,
+    schedule_render,
+)
 
+from ..factories import ReportFactory
 from .utils import assert_html_equal
 
 
@@ -164,3 +183,289 @@ def test_html_processing_extracts_body(html):
 def test_html_processing_wraps_scrollables(input_html, expected):
     html = process_html(input_html)
     assert_html_equal(html, expected)
+
+
+def test_process_html_keeps_text_around_wrapped_elements():
+    html = process_html(
+        "before &amp; <pre>code</pre> after <table><tr><td><pre>x</pre></td></tr></table>"
+    )
+
+    assert html == (
+        "before &amp; "
+        '<div class="overflow-wrapper"><pre>code</pre></div> after '
+        '<div class="overflow-wrapper"><table><tr><td>'
+        '<div class="overflow-wrapper"><pre>x</pre></div>'
+        "</td></tr></table></div>"
+    )
+
+
+def test_process_html_extracts_images(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    png = base64.b64encode(b"\x89PNG").decode()
+    html = f"""
+        <img src="data:image/png;base64,{png}">
+        <img src="https://example.com/plot.png">
+    """
+
+    # images are left inline by default
+    assert_html_equal(process_html(html), html)
+
+    name = f"{hashlib.sha256(b'\x89PNG').hexdigest()}.png"
+    assert_html_equal(
+        process_html(html, extract_images=True),
+        f"""
+            <img loading="lazy" src="/report-images/{name}">
+            <img src="https://example.com/plot.png">
+        """,
+    )
+
+
+@pytest.mark.django_db
+def test_render_report(mocker, bennett_org):
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<html><body><p>foo</p></body></html>"
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    report = ReportFactory(org=bennett_org)
+
+    assert get_render(report) is None
+
+    html = render_report(report)
+
+    assert_html_equal(html, "<p>foo</p>")
+    assert get_render(report).html == html
+
+    rendered = RenderedReport.objects.get()
+    assert rendered.content_hash == content_hash(remote.get_html.return_value)
+    assert rendered.renderer_version == RENDERER_VERSION
+
+    # renders are stored against the cache token, so a new token needs a new render
+    report.refresh_cache_token(refresh_http_cache=False)
+    assert get_render(report) is None
+
+
+@pytest.mark.django_db
+def test_render_report_reuses_renders_of_unchanged_html(mocker, bennett_org):
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<p>foo</p>"
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    process = mocker.patch("reports.rendering.process_html", return_value="<p>foo</p>")
+    report = ReportFactory(org=bennett_org)
+    other_report = ReportFactory(org=bennett_org)
+
+    render_report(report)
+    report.refresh_cache_token(refresh_http_cache=False)
+    render_report(report)
+    render_report(other_report)
+
+    # the html has only been processed once, and its render is shared
+    process.assert_called_once()
+    assert RenderedReport.objects.count() == 1
+    assert ReportRender.objects.count() == 3
+    assert get_render(report).html == "<p>foo</p>"
+    assert get_render(other_report) == get_render(report)
+
+    # changed html is processed again
+    remote.get_html.return_value = "<p>bar</p>"
+    render_report(report)
+    assert process.call_count == 2
+    assert RenderedReport.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_prune_renders(mocker, freezer, bennett_org):
+    remote = mocker.Mock()
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    report = ReportFactory(org=bennett_org)
+
+    freezer.move_to("2021-04-25 09:00")
+    remote.get_html.return_value = "<p>old</p>"
+    render_report(report)
+    old_token = report.cache_token
+
+    # without a render for the current token, the old render is kept
+    report.refresh_cache_token(refresh_http_cache=False)
+    prune_renders()
+    assert ReportRender.objects.filter(cache_token=old_token).exists()
+
+    freezer.move_to("2021-04-25 10:00")
+    remote.get_html.return_value = "<p>new</p>"
+    render_report(report)
+    # renders created recently are kept, as they may not have been linked to their
+    # report yet
+    RenderedReport.objects.create(content_hash="unlinked", renderer_version=1)
+    freezer.move_to("2021-04-25 10:05")
+    prune_renders()
+
+    assert list(ReportRender.objects.values_list("cache_token", flat=True)) == [
+        report.cache_token
+    ]
+    assert set(RenderedReport.objects.values_list("content_hash", flat=True)) == {
+        report.renders.get().rendered.content_hash,
+        "unlinked",
+    }
+
+    freezer.move_to("2021-04-25 10:11")
+    prune_renders()
+    assert RenderedReport.objects.get().html == "<p>new</p>"
+
+
+@pytest.mark.django_db
+def test_prune_renders_for_report(mocker, bennett_org):
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<p>foo</p>"
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    report = ReportFactory(org=bennett_org)
+    other = ReportFactory(org=bennett_org)
+    for rendered in [report, other]:
+        render_report(rendered)
+        rendered.refresh_cache_token(refresh_http_cache=False)
+        render_report(rendered)
+
+    prune_renders(report)
+
+    assert ReportRender.objects.filter(report=report).count() == 1
+    assert ReportRender.objects.filter(report=other).count() == 2
+
+
+@pytest.mark.django_db
+def test_get_stale_render(mocker, bennett_org):
+    remote = mocker.Mock()
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    report = ReportFactory(org=bennett_org)
+    assert get_stale_render(report) is None
+
+    remote.get_html.return_value = "<p>first</p>"
+    render_report(report)
+    report.refresh_cache_token(refresh_http_cache=False)
+    remote.get_html.return_value = "<p>second</p>"
+    render_report(report)
+    report.refresh_cache_token(refresh_http_cache=False)
+
+    assert get_stale_render(report).html == "<p>second</p>"
+
+
+@pytest.mark.django_db
+def test_render_report_uses_job_server_for_job_server_reports(mocker, bennett_org):
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<p>foo</p>"
+    job_server_report = mocker.patch(
+        "reports.rendering.JobServerReport", return_value=remote
+    )
+    report = ReportFactory(org=bennett_org)
+    report.job_server_url = "https://jobs.opensafely.org/"
+
+    render_report(report)
+
+    job_server_report.assert_called_once_with(report, use_cache=True)
+
+
+@pytest.mark.django_db
+def test_schedule_render_when_disabled(mocker, settings, bennett_org):
+    settings.RENDER_REPORTS_IN_BACKGROUND = False
+    thread = mocker.patch("reports.rendering.threading.Thread")
+
+    schedule_render(ReportFactory(org=bennett_org))
+
+    thread.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_schedule_render(mocker, settings, bennett_org):
+    settings.RENDER_REPORTS_IN_BACKGROUND = True
+    thread = mocker.patch("reports.rendering.threading.Thread")
+    report = ReportFactory(org=bennett_org)
+
+    schedule_render(report)
+    # a render for this report is already in flight
+    schedule_render(report)
+
+    key = (report.pk, report.cache_token)
+    thread.assert_called_once_with(
+        target=_render_in_background, args=(report.pk, key), daemon=True
+    )
+    thread.return_value.start.assert_called_once()
+    # the render is locked for other processes until the thread releases it
+    assert not acquire_render_lock(*key)
+    _renders_in_flight.discard(key)
+
+
+@pytest.mark.django_db
+def test_schedule_render_when_rendering_elsewhere(mocker, settings, bennett_org):
+    settings.RENDER_REPORTS_IN_BACKGROUND = True
+    thread = mocker.patch("reports.rendering.threading.Thread")
+    report = ReportFactory(org=bennett_org)
+    key = (report.pk, report.cache_token)
+    # another process is rendering it
+    assert acquire_render_lock(*key)
+
+    schedule_render(report)
+
+    thread.assert_not_called()
+    assert key not in _renders_in_flight
+
+
+@pytest.mark.django_db
+def test_render_in_background(mocker, bennett_org):
+    render = mocker.patch("reports.rendering.render_report")
+    prune = mocker.patch("reports.rendering.prune_renders")
+    mocker.patch("reports.rendering.connections")
+    report = ReportFactory(org=bennett_org)
+    key = (report.pk, report.cache_token)
+    _renders_in_flight.add(key)
+    acquire_render_lock(*key)
+
+    _render_in_background(report.pk, key)
+
+    render.assert_called_once_with(report)
+    prune.assert_called_once_with(report)
+    assert key not in _renders_in_flight
+    assert acquire_render_lock(*key)
+
+
+@pytest.mark.django_db
+def test_render_in_background_failure(mocker, log_output, settings, bennett_org):
+    mocker.patch("reports.rendering.render_report", side_effect=Exception("boom"))
+    mocker.patch("reports.rendering.connections")
+    report = ReportFactory(org=bennett_org)
+    key = (report.pk, report.cache_token)
+    _renders_in_flight.add(key)
+    acquire_render_lock(*key)
+
+    _render_in_background(report.pk, key)
+
+    assert key not in _renders_in_flight
+    assert log_output.entries[-1]["event"] == "Background report render failed"
+    assert log_output.entries[-1]["report_id"] == report.pk
+
+    # the render isn't tried again until the backoff has passed
+    settings.RENDER_REPORTS_IN_BACKGROUND = True
+    thread = mocker.patch("reports.rendering.threading.Thread")
+    schedule_render(report)
+    thread.assert_not_called()
+
+    cache.delete(render_failed_key(*key))
+    schedule_render(report)
+    thread.assert_called_once()
+    _renders_in_flight.discard(key)
+
+
+@pytest.mark.django_db
+def test_render_report_with_image_extraction(mocker, bennett_org, settings):
+    remote = mocker.Mock()
+    remote.get_html.return_value = "<p>foo</p>"
+    mocker.patch("reports.rendering.GithubReport", return_value=remote)
+    process = mocker.patch("reports.rendering.process_html", return_value="<p>foo</p>")
+    report = ReportFactory(org=bennett_org)
+
+    render_report(report)
+    settings.EXTRACT_REPORT_IMAGES = True
+    render_report(report)
+
+    # renders with and without extraction are stored separately
+    assert process.call_args_list == [
+        mocker.call("<p>foo</p>", False),
+        mocker.call("<p>foo</p>", True),
+    ]
+    assert RenderedReport.objects.get(
+        content_hash=content_hash("<p>foo</p>", extract_images=True)
+    )
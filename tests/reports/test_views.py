@@ -1,13 +1,16 @@
+import gzip
 from datetime import date, timedelta
 
 import pytest
 from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from gateway.models import User
 from reports.groups import setup_researchers
-from reports.models import Category, Report
-from reports.rendering import process_html
+from reports.models import Category, RenderedReport, Report
+from reports.rendering import render_report
 from reports.views import report_view
 
 from ..factories import CategoryFactory, ReportFactory, UserFactory
@@ -15,7 +18,7 @@ from .utils import assert_html_equal
 
 
 @pytest.mark.django_db
-def test_landing_view(client, bennett_org):
+def test_landing_view(client, bennett_org, django_capture_on_commit_callbacks):
     """Test landing view context"""
     assert Report.objects.exists() is False
     # By default we have one Category, set up in the migration
@@ -26,10 +29,14 @@ def test_landing_view(client, bennett_org):
     assert list(response.context["categories"]) == []
 
     # when Reports exist, their categories are included in the context
-    report1 = ReportFactory(org=bennett_org)
-    report2 = ReportFactory(org=bennett_org, title="test1")
+    with django_capture_on_commit_callbacks(execute=True):
+        report1 = ReportFactory(org=bennett_org)
+        report2 = ReportFactory(org=bennett_org, title="test1")
     response = client.get(reverse("landing"))
-    assert list(response.context["categories"]) == [report1.category, report2.category]
+    assert [category.id for category in response.context["categories"]] == [
+        report1.category.id,
+        report2.category.id,
+    ]
 
 
 @pytest.mark.django_db
@@ -51,16 +58,17 @@ def test_landing_view_ordering(client, bennett_org):
 
     response = client.get(reverse("landing"))
     # Categories are in alphabetical order by name
-    assert list(response.context["categories"].values_list("name", flat=True)) == [
+    assert [category.name for category in response.context["categories"]] == [
         "Reports",
         "Test",
     ]
     # Within each category, reports are in alphabetical order by menu_name
     reports_category_context, test_category_context = response.context["categories"]
-    assert list(
-        reports_category_context.reports.values_list("menu_name", flat=True)
-    ) == ["bcd", "jkl"]
-    assert list(test_category_context.reports.values_list("menu_name", flat=True)) == [
+    assert [report.menu_name for report in reports_category_context.reports] == [
+        "bcd",
+        "jkl",
+    ]
+    assert [report.menu_name for report in test_category_context.reports] == [
         "abc",
         "def",
         "xyz",
@@ -117,7 +125,7 @@ def test_landing_view_draft_reports_permissions(
     )
 
     response = client.get(reverse("landing"))
-    assert response.context["categories"].count() == len(expected_category_names)
+    assert len(response.context["categories"]) == len(expected_category_names)
     categories = response.context["categories"]
     assert [category.name for category in categories] == expected_category_names
 
@@ -268,12 +276,13 @@ def test_report_view(client, bennett_org):
         branch="master",
         report_html_file_path="test-outputs/output.html",
     )
+    render_report(report)
     response = client.get(report.get_absolute_url())
 
     assert "X-Robots-Tag" not in response.headers
 
     assert_html_equal(
-        process_html(response.context["remote"].get_html()),
+        response.context["rendered_html"],
         """
             <h1>A Test Output HTML file</h1>
             <p>The test content</p>
@@ -339,12 +348,7 @@ def test_report_view_does_not_set_noindex_header_for_non_archive_reports(
 
 
 @pytest.mark.django_db
-def test_archive_banner_is_rendered_for_archive_reports(client, mocker, bennett_org):
-    remote = mocker.Mock()
-    remote.last_updated = date(2021, 1, 1)
-    remote.get_html.return_value = "<h1>Archived report</h1>"
-    mocker.patch("reports.views.GithubReport", return_value=remote)
-
+def test_archive_banner_is_rendered_for_archive_reports(client, bennett_org):
     report = ReportFactory(
         category=CategoryFactory(name="Archive"),
         org=bennett_org,
@@ -450,8 +454,8 @@ def test_report_view_cache(client, log_output, bennett_org):
 @pytest.mark.django_db
 def test_report_view_last_updated(client, log_output, bennett_org):
     """
-    Test that the last updated field (which is fetched on page load and stored on the
-    model) is displayed properly on the report page.
+    Test that the last updated field (which is fetched when the report is rendered and
+    stored on the model) is displayed properly on the report page.
     """
     report = ReportFactory(
         org=bennett_org,
@@ -462,10 +466,369 @@ def test_report_view_last_updated(client, log_output, bennett_org):
     )
     assert report.last_updated is None
 
-    # fetch report
+    # render and fetch report
+    render_report(report)
     response = client.get(report.get_absolute_url())
     assert response.status_code == 200
 
     report.refresh_from_db()
     assert report.last_updated is not None
     assert report.last_updated.strftime("%d %b %Y") in response.rendered_content
+
+
+@pytest.mark.django_db
+def test_report_view_serves_pre_rendered_html(client, mocker, rendered_report):
+    remote_cls = mocker.patch("reports.rendering.GithubReport")
+    schedule_render = mocker.patch("reports.views.schedule_render")
+
+    response = client.get(rendered_report.get_absolute_url())
+
+    assert response.status_code == 200
+    assert_html_equal(response.context["rendered_html"], "<h1>A rendered report</h1>")
+    assert "This report is being prepared" not in response.rendered_content
+    # the report was already rendered; nothing is fetched or scheduled
+    remote_cls.assert_not_called()
+    schedule_render.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_report_view_gzips_around_pre_compressed_html(client, rendered_report):
+    url = rendered_report.get_absolute_url()
+    uncompressed = client.get(url)
+    response = client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+
+    assert response.status_code == 200
+    assert response["Content-Encoding"] == "gzip"
+    assert response["Vary"] == uncompressed["Vary"] == "Accept-Encoding, Cookie"
+    page = gzip.decompress(response.content).decode()
+    assert "<h1>A rendered report</h1>" in page
+    # the page is the same as the uncompressed one, apart from per-request tokens
+    assert page.count("<") == uncompressed.content.decode().count("<")
+
+
+@pytest.mark.django_db
+def test_report_view_without_pre_compressed_html(client, rendered_report):
+    # as for renders made before the compressed html was added
+    RenderedReport.objects.update(html_deflate=None, html_crc32=None, html_length=None)
+
+    response = client.get(
+        rendered_report.get_absolute_url(), HTTP_ACCEPT_ENCODING="gzip"
+    )
+
+    assert "Content-Encoding" not in response
+    assert "<h1>A rendered report</h1>" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_report_view_placeholder_while_rendering(client, mocker, bennett_org):
+    remote_cls = mocker.patch("reports.rendering.GithubReport")
+    schedule_render = mocker.patch("reports.views.schedule_render")
+
+    report = ReportFactory(org=bennett_org)
+
+    response = client.get(report.get_absolute_url())
+
+    assert response.status_code == 200
+    assert response.context["rendered_html"] is None
+    assert "This report is being prepared" in response.rendered_content
+    assert '<meta http-equiv="refresh"' in response.rendered_content
+    # the view never fetches html itself, it only asks for a render
+    remote_cls.assert_not_called()
+    schedule_render.assert_called_once_with(report)
+
+
+@pytest.mark.django_db
+def test_report_view_serves_stale_render_while_rendering(
+    client, mocker, rendered_report
+):
+    schedule_render = mocker.patch("reports.views.schedule_render")
+    rendered_report.refresh_cache_token(refresh_http_cache=False)
+
+    response = client.get(rendered_report.get_absolute_url())
+
+    assert response.status_code == 200
+    assert response.context["is_stale"]
+    assert "<h1>A rendered report</h1>" in response.rendered_content
+    assert "This report is being updated" in response.rendered_content
+    assert '<meta http-equiv="refresh"' not in response.rendered_content
+    assert "ETag" not in response
+    assert "no-cache" in response["Cache-Control"]
+    schedule_render.assert_called_once_with(rendered_report)
+
+    # once the new render is ready it replaces the stale one
+    render_report(rendered_report)
+    response = client.get(rendered_report.get_absolute_url())
+    assert not response.context["is_stale"]
+    assert "This report is being updated" not in response.rendered_content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_name", ["landing", "report_view"])
+def test_query_count_does_not_depend_on_report_count(client, bennett_org, url_name):
+    category = CategoryFactory()
+    report = ReportFactory(org=bennett_org, category=category)
+    url = reverse(url_name, args=[report.slug] if url_name == "report_view" else [])
+    # warm up any caches first
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as one_report_queries:
+        client.get(url)
+
+    for _ in range(5):
+        ReportFactory(org=bennett_org, category=category)
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as many_report_queries:
+        client.get(url)
+
+    assert len(many_report_queries) == len(one_report_queries)
+
+
+@pytest.mark.django_db
+def test_report_image(client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    name = f"{'a' * 64}.png"
+    (tmp_path / "report-images").mkdir()
+    (tmp_path / "report-images" / name).write_bytes(b"\x89PNG")
+
+    response = client.get(reverse("report_image", kwargs={"name": name}))
+
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b"\x89PNG"
+    assert response["Content-Type"] == "image/png"
+    assert response["Cache-Control"] == "public, max-age=31536000, immutable"
+
+
+@pytest.mark.django_db
+def test_report_image_not_found(client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+    response = client.get(reverse("report_image", kwargs={"name": f"{'a' * 64}.png"}))
+
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_report_view_public_cache_headers(client, rendered_report):
+    response = client.get(rendered_report.get_absolute_url())
+
+    assert response["ETag"]
+    assert response["Cache-Control"] == (
+        "public, max-age=0, s-maxage=300, must-revalidate"
+    )
+
+    # the page is unchanged, so isn't rendered again
+    with CaptureQueriesContext(connection) as queries:
+        not_modified = client.get(
+            rendered_report.get_absolute_url(), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+    assert not_modified.status_code == 304
+    assert not_modified["ETag"] == response["ETag"]
+    assert not_modified["Cache-Control"] == response["Cache-Control"]
+    assert not_modified.templates == []
+    assert not any("html_deflate" in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db
+def test_report_view_etag_changes(
+    client, rendered_report, bennett_org, django_capture_on_commit_callbacks
+):
+    def etag(**extra):
+        return client.get(rendered_report.get_absolute_url(), **extra)["ETag"]
+
+    initial = etag()
+    assert etag() == initial
+    assert etag(HTTP_ACCEPT_ENCODING="gzip") != initial
+
+    # a change to the navigation tree
+    with django_capture_on_commit_callbacks(execute=True):
+        ReportFactory(org=bennett_org, is_draft=False)
+    changed_navigation = etag()
+    assert changed_navigation != initial
+
+    # a change to the report
+    rendered_report.refresh_cache_token(refresh_http_cache=False)
+    render_report(rendered_report)
+    changed_report = etag()
+    assert changed_report != changed_navigation
+
+    # a logged in user
+    client.force_login(UserFactory())
+    assert etag() != changed_report
+
+
+@pytest.mark.django_db
+def test_report_view_private_cache_headers(
+    client, rendered_report, user_with_permission
+):
+    client.force_login(user_with_permission)
+    response = client.get(rendered_report.get_absolute_url())
+    assert response["Cache-Control"] == "private, no-cache"
+
+    client.logout()
+    rendered_report.is_draft = True
+    rendered_report.save()
+    client.force_login(user_with_permission)
+    response = client.get(rendered_report.get_absolute_url())
+    assert response["Cache-Control"] == "private, no-cache"
+
+
+@pytest.mark.django_db
+def test_permissions_are_checked_once_per_request(
+    client, mocker, rendered_report, user_with_permission
+):
+    has_perm = mocker.spy(User, "has_perm")
+    client.force_login(user_with_permission)
+
+    # the report view, its ETag and the navigation tree all need to know whether the
+    # user can view drafts
+    client.get(rendered_report.get_absolute_url())
+    assert has_perm.call_count == 1
+
+    has_perm.reset_mock()
+    client.get(reverse("landing"))
+    assert has_perm.call_count == 1
+
+
+@pytest.mark.django_db
+def test_report_view_placeholder_is_not_cached(client, mocker, bennett_org):
+    mocker.patch("reports.views.schedule_render")
+    report = ReportFactory(org=bennett_org, is_draft=False)
+
+    response = client.get(report.get_absolute_url())
+
+    assert "ETag" not in response
+    assert "no-cache" in response["Cache-Control"]
+
+
+@pytest.mark.django_db
+def test_report_view_force_update(client, rendered_report, mock_repo_url):
+    mock_repo_url("https://github.com/opensafely/test")
+    initial_token = rendered_report.cache_token
+
+    response = client.get(rendered_report.get_absolute_url() + "?force-update")
+
+    assert response.status_code == 302
+    assert response.url == rendered_report.get_absolute_url()
+    assert "no-cache" in response["Cache-Control"]
+    rendered_report.refresh_from_db()
+    assert rendered_report.cache_token != initial_token
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("encoding", ["gzip", ""])
+def test_report_view_streams_report_pages(
+    client, rendered_report, settings, mocker, encoding
+):
+    page = client.get(rendered_report.get_absolute_url(), HTTP_ACCEPT_ENCODING=encoding)
+    settings.STREAM_REPORT_PAGES = True
+    mocker.patch("reports.views.STREAM_CHUNK_SIZE", 10)
+
+    response = client.get(
+        rendered_report.get_absolute_url(), HTTP_ACCEPT_ENCODING=encoding
+    )
+
+    assert response.streaming
+    assert response.get("Content-Encoding") == page.get("Content-Encoding")
+    assert response["Vary"] == page["Vary"]
+    assert response["ETag"] == page["ETag"]
+    assert response["Cache-Control"] == page["Cache-Control"]
+    content = b"".join(response.streaming_content)
+    if encoding:
+        content, page_content = gzip.decompress(content), gzip.decompress(page.content)
+    else:
+        page_content = page.content
+    assert b"<h1>A rendered report</h1>" in content
+    # the same page, apart from per-request tokens
+    assert content.count(b"<") == page_content.count(b"<")
+
+
+@pytest.mark.django_db
+def test_report_view_streams_report_html_in_chunks(
+    client, rendered_report, settings, mocker
+):
+    settings.STREAM_REPORT_PAGES = True
+    mocker.patch("reports.views.STREAM_CHUNK_SIZE", 10)
+
+    response = client.get(rendered_report.get_absolute_url())
+    parts = list(response.streaming_content)
+
+    assert parts[1:4] == [b"<h1>A rend", b"ered repor", b"t</h1>"]
+    assert b"</html>" in parts[-1]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("encoding", ["gzip", ""])
+def test_report_view_streams_page_before_loading_html(
+    client, rendered_report, settings, encoding
+):
+    settings.STREAM_REPORT_PAGES = True
+
+    response = client.get(
+        rendered_report.get_absolute_url(), HTTP_ACCEPT_ENCODING=encoding
+    )
+    parts = iter(response.streaming_content)
+
+    with CaptureQueriesContext(connection) as queries:
+        next(parts)
+    assert len(queries) == 0
+
+    # the html is loaded once the start of the page has been sent
+    with CaptureQueriesContext(connection) as queries:
+        list(parts)
+    assert len(queries) == 1
+    column = '"html_deflate"' if encoding else '"html"'
+    assert column in queries[0]["sql"]
+
+
+@pytest.mark.django_db
+def test_report_view_front_matter_change_keeps_render(client, mocker, rendered_report):
+    schedule_render = mocker.patch("reports.views.schedule_render")
+    response = client.get(rendered_report.get_absolute_url())
+    assert "A test report" not in response.rendered_content
+
+    report = Report.objects.get(pk=rendered_report.pk)
+    report.title = "A test report"
+    report.save()
+    changed = client.get(rendered_report.get_absolute_url())
+
+    # the header is updated, and the current render is still served
+    assert "A test report" in changed.rendered_content
+    assert "<h1>A rendered report</h1>" in changed.rendered_content
+    assert not changed.context["is_stale"]
+    assert changed["ETag"] != response["ETag"]
+    schedule_render.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_landing_cache_headers(client):
+    response = client.get(reverse("landing"))
+    assert response["Cache-Control"] == "public, max-age=0, must-revalidate"
+
+    client.force_login(UserFactory())
+    response = client.get(reverse("landing"))
+    assert "no-store" in response["Cache-Control"]
+
+
+@pytest.mark.django_db
+def test_report_view_queries(client, rendered_report):
+    url = rendered_report.get_absolute_url()
+
+    def tables_queried():
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        return [
+            query["sql"].split(" FROM ")[1].split()[0]
+            for query in queries
+            if query["sql"].startswith("SELECT")
+        ]
+
+    # the org is fetched with the report
+    cold = tables_queried()
+    assert '"reports_org"' not in cold
+    assert cold.count('"reports_link"') == 1
+
+    # links are only read to render the header, which is now cached
+    warm = tables_queried()
+    assert '"reports_link"' not in warm
+    assert warm.count('"reports_report"') == 1
@@ -0,0 +1,44 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+
+from reports.visibility import Visibility, user_visibility
+
+from ..factories import UserFactory
+
+
+@pytest.mark.parametrize(
+    "can_view_drafts,is_staff,name",
+    [
+        (False, False, "public"),
+        (True, False, "drafts"),
+        (False, True, "staff"),
+        (True, True, "staff-drafts"),
+    ],
+)
+def test_visibility_name(can_view_drafts, is_staff, name):
+    assert Visibility(can_view_drafts, is_staff).name == name
+
+
+def test_user_visibility_anonymous():
+    assert user_visibility(AnonymousUser()) == Visibility(
+        can_view_drafts=False, is_staff=False
+    )
+
+
+@pytest.mark.django_db
+def test_user_visibility(user_with_permission):
+    assert user_visibility(user_with_permission) == Visibility(
+        can_view_drafts=True, is_staff=False
+    )
+    assert user_visibility(UserFactory(is_staff=True)) == Visibility(
+        can_view_drafts=False, is_staff=True
+    )
+
+
+@pytest.mark.django_db
+def test_user_visibility_is_worked_out_once_per_user(mocker, user_with_permission):
+    has_perm = mocker.spy(user_with_permission, "has_perm")
+
+    first = user_visibility(user_with_permission)
+    assert user_visibility(user_with_permission) is first
+    has_perm.assert_called_once_with("reports.view_draft")